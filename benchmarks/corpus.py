@@ -0,0 +1,101 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""Synthetic corpus generator for the benchmarks.
+
+The files are copies of the test fixtures ('changed.py', 'comment_*'
+and 'unused_import_*'), distributed over nested directories. Large files
+are created by appending generated functions with typing annotations to
+'changed.py'. The same seed always produces the same corpus.
+
+Usage: python -m benchmarks.corpus DIR [--files NUM] [--large-files NUM]
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+import random
+
+FIXTURE_PATH = Path(__file__).parent.parent / "tests" / "fixtures"
+SEED_PATTERNS = ("changed.py", "comment_[0-9].py", "unused_import_[0-9].py")
+FILES_PER_DIRECTORY = 500
+
+LARGE_FILE_SEED = "changed.py"
+LARGE_FILE_BLOCK = '''
+
+def func_{index}(arg: List[int], other: Union[int, str] = 0) -> Any:
+    """Generated function {index}."""
+    values: List[Union[int, str]] = [other, *arg]
+    return values
+'''
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    """Shape of a synthetic corpus."""
+
+    files: int = 1000
+    large_files: int = 0
+    large_file_blocks: int = 5000
+    seed: int = 0
+
+
+def load_seeds() -> dict[str, str]:
+    """Return content of the fixtures used as seed, sorted by name."""
+    seeds = {
+        file_.name: file_.read_text(encoding="utf-8")
+        for pattern in SEED_PATTERNS
+        for file_ in FIXTURE_PATH.glob(pattern)
+    }
+    return dict(sorted(seeds.items()))
+
+
+def generate_corpus(target: Path, spec: CorpusSpec) -> list[str]:
+    """Write corpus to target directory.
+
+    Return the list of generated filenames.
+    """
+    rng = random.Random(spec.seed)
+    seeds = load_seeds()
+    seed_names = list(seeds)
+    filenames: list[str] = []
+
+    for index in range(spec.files):
+        name = rng.choice(seed_names)
+        directory = target / f"pkg_{index // FILES_PER_DIRECTORY:04d}"
+        if index % FILES_PER_DIRECTORY == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        file_ = directory / f"{Path(name).stem}_{index:06d}.py"
+        file_.write_text(seeds[name], encoding="utf-8")
+        filenames.append(str(file_))
+
+    if spec.large_files:
+        directory = target / "large"
+        directory.mkdir(parents=True, exist_ok=True)
+        content = seeds[LARGE_FILE_SEED] + "".join(
+            LARGE_FILE_BLOCK.format(index=index) for index in range(spec.large_file_blocks))
+        for index in range(spec.large_files):
+            file_ = directory / f"large_{index:04d}.py"
+            file_.write_text(content, encoding="utf-8")
+            filenames.append(str(file_))
+
+    return filenames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('target', type=Path)
+    parser.add_argument('--files', type=int, default=CorpusSpec.files)
+    parser.add_argument('--large-files', type=int, default=CorpusSpec.large_files)
+    parser.add_argument('--large-file-blocks', type=int, default=CorpusSpec.large_file_blocks)
+    parser.add_argument('--seed', type=int, default=CorpusSpec.seed)
+    args = parser.parse_args()
+
+    spec = CorpusSpec(args.files, args.large_files, args.large_file_blocks, args.seed)
+    filenames = generate_corpus(args.target, spec)
+    print(f"Generated {len(filenames)} files in {args.target}")
+
+
+if __name__ == '__main__':
+    main()
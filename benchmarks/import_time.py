@@ -0,0 +1,94 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""Startup benchmark for the entry point.
+
+Runs each scenario in a new interpreter and reports the median wall time
+and the total import time ('-X importtime'). Paths which exit before
+a file is updated mustn't import any of the tools.
+
+Usage: python -m benchmarks.import_time [--repeat NUM] [--budget MS]
+
+Exits with 1 if a scenario imports one of the tools or if the median
+wall time exceeds the budget.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_PATH = Path(__file__).parent.parent
+TOOL_MODULES = ("autoflake", "isort", "pyupgrade", "reorder_python_imports")
+
+SCENARIOS = {
+    "import": ["-c", "import python_typing_update.__main__"],
+    "help": ["-m", "python_typing_update", "--help"],
+    "missing-file": ["-m", "python_typing_update", "--no-daemon", "missing.py"],
+}
+
+
+def run_scenario(argv: list[str], cwd: str) -> tuple[float, float, set[str]]:
+    """Return wall time, total import time (both in ms) and the imported tools."""
+    env = {**os.environ, "PYTHONPATH": str(ROOT_PATH)}
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        cwd=cwd, env=env, capture_output=True, text=True, check=False,
+    )
+    wall_time = (time.perf_counter() - start) * 1000
+    import_time = 0.0
+    tools: set[str] = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if (package := name.strip().split(".")[0]) in TOOL_MODULES:
+            tools.add(package)
+        if not name.startswith("  "):
+            # -> Top-level import, nested ones are included in its cumulative time
+            import_time += int(cumulative) / 1000
+    return wall_time, import_time, tools
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument(
+        '--budget', type=float, metavar="MS",
+        help="Fail if the median wall time of a scenario exceeds MS",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, argv in SCENARIOS.items():
+            wall_times: list[float] = []
+            import_times: list[float] = []
+            tools: set[str] = set()
+            for _ in range(args.repeat):
+                wall_time, import_time, tools_run = run_scenario(argv, tmp_dir)
+                wall_times.append(wall_time)
+                import_times.append(import_time)
+                tools |= tools_run
+            wall_time = statistics.median(wall_times)
+            print(
+                f"{name:<14} wall: {wall_time:7.1f}ms"
+                f"  imports: {statistics.median(import_times):7.1f}ms"
+            )
+            if tools:
+                print(f"  Imported tools: {', '.join(sorted(tools))}")
+                failed = True
+            if args.budget is not None and wall_time > args.budget:
+                print(f"  Over budget: {wall_time:.1f}ms > {args.budget:.1f}ms")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
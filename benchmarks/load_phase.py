@@ -0,0 +1,51 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""Micro-benchmark for the token analysis of the load phase.
+
+Compares the previous two scans (comment check + import extraction)
+with the single pass of 'analyze_imports'.
+
+Usage: python -m benchmarks.load_phase [--number NUM]
+"""
+from __future__ import annotations
+
+import argparse
+import io
+from pathlib import Path
+import timeit
+
+from python_typing_update.utils import (
+    analyze_imports, check_comment_between_imports, extract_imports)
+
+FIXTURE_PATH = Path(__file__).parent.parent / "tests" / "fixtures"
+
+
+def two_scans(data: list[str]) -> None:
+    for content in data:
+        check_comment_between_imports(io.StringIO(content))
+        extract_imports(io.StringIO(content))
+
+
+def single_scan(data: list[str]) -> None:
+    for content in data:
+        analyze_imports(io.StringIO(content))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    data = [file_.read_text(encoding="utf-8") for file_ in sorted(FIXTURE_PATH.glob("*.py"))]
+    time_two_scans = min(timeit.repeat(lambda: two_scans(data), number=args.number, repeat=5))
+    time_single_scan = min(timeit.repeat(lambda: single_scan(data), number=args.number, repeat=5))
+
+    print(f"Files: {len(data)} x {args.number}")
+    print(f"Two scans:   {time_two_scans:.3f}s")
+    print(f"Single scan: {time_single_scan:.3f}s")
+    print(f"Speedup:     {time_two_scans / time_single_scan:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""End-to-end throughput benchmark.
+
+Each repetition generates a fresh synthetic corpus (see 'benchmarks.corpus')
+and runs 'python-typing-update' on it in a new interpreter, with an empty
+cache and without a daemon. Reported are files/sec, the peak RSS of the
+tool and, if the checkout supports '--profile-json', the time per phase.
+The results can be saved as JSON and compared across commits. Only options
+which exist on every commit are passed, so a different checkout can be
+benchmarked with '--source', e.g. one created with 'git worktree add'.
+
+Usage:
+    python -m benchmarks.throughput run [--scenario NAME ...] [--repeat NUM]
+        [--source PATH] [--output PATH] [-- TOOL_ARGS ...]
+    python -m benchmarks.throughput compare BASELINE CURRENT [--threshold PCT]
+
+Unix only, the peak RSS is read with 'os.wait4'.
+"""
+from __future__ import annotations
+
+import argparse
+from dataclasses import asdict
+import json
+import os
+from pathlib import Path
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+from typing import Any
+
+from benchmarks.corpus import CorpusSpec, generate_corpus
+
+ROOT_PATH = Path(__file__).parent.parent
+RESULT_FORMAT = 2
+
+# Run in the source tree, the file list is passed as file to stay below the argv limit
+RUNNER = """\
+import sys, time
+from python_typing_update.__main__ import main
+file_list, result_file, *tool_args = sys.argv[1:]
+with open(file_list, encoding="utf-8") as fp:
+    filenames = fp.read().splitlines()
+start = time.perf_counter()
+returncode = main([*tool_args, *filenames])
+with open(result_file, "w", encoding="utf-8") as fp:
+    fp.write(f"{returncode} {time.perf_counter() - start}")
+"""
+
+SCENARIOS = {
+    "1k": CorpusSpec(files=1_000),
+    "10k": CorpusSpec(files=10_000),
+    "100k": CorpusSpec(files=100_000),
+    "large": CorpusSpec(files=0, large_files=10, large_file_blocks=2_000),
+}
+
+
+def _peak_rss_mb(rusage: resource.struct_rusage) -> float:
+    """Return peak RSS in MB."""
+    # Linux reports KB, macOS bytes
+    return rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _git_commit(source: Path) -> str | None:
+    process = subprocess.run(
+        ["git", "describe", "--always", "--dirty"],
+        cwd=source, capture_output=True, text=True, check=False,
+    )
+    return process.stdout.strip() or None
+
+
+def _supports_profile_json(source: Path) -> bool:
+    """Check if the checkout has the '--profile-json' option."""
+    process = subprocess.run(
+        [sys.executable, "-m", "python_typing_update", "--help"],
+        cwd=source, capture_output=True, text=True, check=True,
+    )
+    return "--profile-json" in process.stdout
+
+
+def run_once(
+    tmp: Path, filenames: list[str], source: Path, tool_args: list[str], profile: bool,
+) -> dict[str, Any]:
+    """Run python-typing-update from source in a new interpreter and return the measurements.
+
+    The cache and the daemon socket are redirected to tmp,
+    so every run starts with an empty cache and isn't forwarded.
+    """
+    file_list = tmp / "files.txt"
+    file_list.write_text("\n".join(filenames), encoding="utf-8")
+    result_file = tmp / "result.txt"
+    profile_json = tmp / "profile.json"
+    argv = ["--disable-committed-check", *tool_args]
+    if profile:
+        argv = ["--profile-json", str(profile_json), *argv]
+    env = {**os.environ, "XDG_CACHE_HOME": str(tmp / "cache"), "XDG_RUNTIME_DIR": str(tmp)}
+
+    with subprocess.Popen(
+        [sys.executable, "-c", RUNNER, str(file_list), str(result_file), *argv],
+        cwd=source, env=env, stdout=subprocess.DEVNULL,
+    ) as process:
+        # Includes the pool workers the tool waited for
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+    returncode, elapsed = result_file.read_text(encoding="utf-8").split()
+    result: dict[str, Any] = {
+        "returncode": int(returncode),
+        "files": len(filenames),
+        "elapsed": float(elapsed),
+        "peak_rss_mb": _peak_rss_mb(rusage),
+        "phases": {},
+        "stages": {},
+    }
+    if profile:
+        data = json.loads(profile_json.read_text(encoding="utf-8"))
+        result["phases"] = data["phases"]
+        result["stages"] = {stage: values["total"] for stage, values in data["stages"].items()}
+    return result
+
+
+def run_scenario(spec: CorpusSpec, repeat: int, source: Path, tool_args: list[str]) -> dict[str, Any]:
+    """Run benchmark for corpus spec and return the median run."""
+    profile = _supports_profile_json(source)
+    runs: list[dict[str, Any]] = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            filenames = generate_corpus(Path(tmp, "corpus"), spec)
+            runs.append(run_once(Path(tmp), filenames, source, tool_args, profile))
+
+    runs.sort(key=lambda run: run["elapsed"])
+    result = runs[len(runs) // 2]
+    result["files_per_sec"] = result["files"] / result["elapsed"]
+    result["elapsed_all"] = [run["elapsed"] for run in runs]
+    result["spec"] = asdict(spec)
+    return result
+
+
+def run(args: argparse.Namespace) -> int:
+    tool_args = [arg for arg in args.tool_args if arg != "--"]
+    results: dict[str, Any] = {
+        "format": RESULT_FORMAT,
+        "commit": _git_commit(args.source),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "tool_args": tool_args,
+        "scenarios": {},
+    }
+    for name in args.scenario or ["1k"]:
+        result = run_scenario(SCENARIOS[name], args.repeat, args.source, tool_args)
+        results["scenarios"][name] = result
+        print(
+            f"{name:>6}: {result['files']} files in {result['elapsed']:.2f}s "
+            f"({result['files_per_sec']:.1f} files/sec), peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+        if result["phases"]:
+            phases = ", ".join(f"{phase} {total:.2f}s" for phase, total in result["phases"].items())
+            print(f"        {phases}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    """Compare two result files. Return 1 if throughput regressed beyond threshold."""
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    current = json.loads(args.current.read_text(encoding="utf-8"))
+    if baseline.get("format") != current.get("format"):
+        print("Warning! Results were recorded with different versions of the benchmark")
+    if baseline["tool_args"] != current["tool_args"]:
+        print("Warning! Results were recorded with different tool args")
+
+    print(f"{baseline['commit']} -> {current['commit']}")
+    print(f"{'Scenario':<10} {'Files/sec':>21} {'Change':>8} {'Peak RSS (MB)':>17}")
+    regression = False
+    for name, result in current["scenarios"].items():
+        if (base := baseline["scenarios"].get(name)) is None:
+            continue
+        change = (result["files_per_sec"] / base["files_per_sec"] - 1) * 100
+        regression |= change < -args.threshold
+        print(
+            f"{name:<10} {base['files_per_sec']:>10.1f}{result['files_per_sec']:>11.1f} "
+            f"{change:>+7.1f}% {base['peak_rss_mb']:>8.0f}{result['peak_rss_mb']:>9.0f}"
+        )
+    return 1 if regression else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = subparsers.add_parser("run", help="Run benchmark scenarios")
+    parser_run.add_argument(
+        '--scenario', action='append', choices=list(SCENARIOS),
+        help="Scenario to run, can be repeated (default: 1k)",
+    )
+    parser_run.add_argument('--repeat', type=int, default=3)
+    parser_run.add_argument(
+        '--source', type=Path, default=ROOT_PATH,
+        help="Checkout of python-typing-update to benchmark (default: this one)",
+    )
+    parser_run.add_argument('--output', type=Path, help="Save results as JSON")
+    parser_run.add_argument(
+        'tool_args', nargs=argparse.REMAINDER,
+        help="Additional args for python-typing-update, after '--'",
+    )
+
+    parser_compare = subparsers.add_parser("compare", help="Compare two result files")
+    parser_compare.add_argument('baseline', type=Path)
+    parser_compare.add_argument('current', type=Path)
+    parser_compare.add_argument(
+        '--threshold', type=float, default=10.0,
+        help="Max allowed decrease of files/sec in percent (default: %(default)s)",
+    )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
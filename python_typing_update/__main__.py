@@ -4,12 +4,13 @@
 from __future__ import annotations
 
 import argparse
-import asyncio
 import logging
+import os
 import sys
 from typing import Any
 
-from .main import async_run
+from .daemon import (
+    async_serve, daemon_supported, default_socket_path, forward)
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +34,18 @@ class CustomHelpFormatter(argparse.HelpFormatter):
         )
 
 
-async def async_main(argv: list[str] | None = None) -> int:
+def shard_type(value: str) -> tuple[int, int]:
+    """Parse shard 'I/N', with 1 <= I <= N."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected I/N") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', I has to be between 1 and N")
+    return index, count
+
+
+def create_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Tool to update Python typing syntax.",
         formatter_class=CustomHelpFormatter,
@@ -41,6 +53,7 @@ async def async_main(argv: list[str] | None = None) -> int:
     formatter_options = parser.add_argument_group("select optional formatter")
     mode_options = parser.add_argument_group("select different mode")
     py_version_options = parser.add_argument_group("python version options")
+    daemon_options = parser.add_argument_group("daemon options")
 
     parser.add_argument(
         '-v', '--verbose',
@@ -49,15 +62,42 @@ async def async_main(argv: list[str] | None = None) -> int:
     )
     parser.add_argument(
         'filenames',
-        nargs='+',
+        nargs='*',
+        help="Files, directories or glob patterns. Directories are searched for '.py' files",
+    )
+    parser.add_argument(
+        '--exclude', metavar="PATTERN", action='append', default=[],
+        help="Skip discovered paths matching the gitignore style PATTERN. Can be repeated",
     )
     parser.add_argument(
         '--limit', type=int, default=0,
-        help="Max number of files that should be changed. No performance improvement!",
+        help="Max number of files that should be changed. Stop once it's reached",
     )
     parser.add_argument(
         '--concurrent-files', metavar="NUM", type=int, default=100,
-        help="Number of files to process concurrently during initial load. (default: %(default)s)"
+        help="Number of files to process concurrently per stage. (default: %(default)s)"
+    )
+    parser.add_argument(
+        '-j', '--jobs', metavar="NUM", type=int, default=os.cpu_count() or 1,
+        help="Number of worker processes to run the update in. (default: CPU count)"
+    )
+    parser.add_argument(
+        '--cache-dir', metavar="DIR",
+        help="Directory for the result cache. (default: $XDG_CACHE_HOME/python-typing-update)",
+    )
+    parser.add_argument(
+        '--cache-max-size', metavar="MB", type=int, default=256,
+        help="Max size of the result cache in MB. (default: %(default)s)",
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help="Don't use the result cache",
+    )
+    parser.add_argument(
+        '--no-prefilter',
+        action='store_true',
+        help="Run all files through the update, even if they don't reference 'typing'",
     )
     parser.add_argument(
         '--full-reorder',
@@ -74,6 +114,31 @@ async def async_main(argv: list[str] | None = None) -> int:
         action='store_true',
         help="Don't abort with uncommitted changes. Don't use it in production!",
     )
+    parser.add_argument(
+        '--since', metavar="REF",
+        help="Only process files changed since the merge-base of REF and HEAD",
+    )
+    parser.add_argument(
+        '--shard', metavar="I/N", type=shard_type,
+        help="Only process the I-th of N stable partitions of the files",
+    )
+    parser.add_argument(
+        '--summary-json', metavar="PATH",
+        help="Write the summary to PATH as JSON. Merge multiple with 'python -m python_typing_update.summary'",
+    )
+    parser.add_argument(
+        '--report-json', metavar="PATH",
+        help="Write status, removed imports and stage timings per file to PATH as JSON Lines",
+    )
+    parser.add_argument(
+        '--profile-stages',
+        action='store_true',
+        help="Print wall time per phase, stage and the slowest files",
+    )
+    parser.add_argument(
+        '--profile-json', metavar="PATH",
+        help="Write stage timings to PATH as JSON",
+    )
 
     group_formatter = formatter_options.add_mutually_exclusive_group()
     group_formatter.add_argument(
@@ -93,6 +158,11 @@ async def async_main(argv: list[str] | None = None) -> int:
         action='store_true',
         help="Check if files would be updated",
     )
+    group_mode.add_argument(
+        '--diff',
+        action='store_true',
+        help="Print a unified diff for each file which would be updated",
+    )
     group_mode.add_argument(
         '--force',
         action='store_true',
@@ -127,12 +197,33 @@ async def async_main(argv: list[str] | None = None) -> int:
         action='store_const', dest='min_version', const=(3, 14),
     )
 
-    argv = argv or sys.argv[1:]
+    group_daemon = daemon_options.add_mutually_exclusive_group()
+    group_daemon.add_argument(
+        '--daemon',
+        action='store_true',
+        help="Keep the tools loaded and run forwarded requests",
+    )
+    group_daemon.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help="Don't forward run to a running daemon",
+    )
+    daemon_options.add_argument(
+        '--daemon-socket', metavar="PATH",
+        help="Unix socket of the daemon. (default: $XDG_RUNTIME_DIR/python-typing-update-UID.sock)",
+    )
+    return parser
+
+
+async def async_main(argv: list[str] | None = None) -> int:
+    parser = create_parser()
+    argv = argv if argv is not None else sys.argv[1:]
     args = parser.parse_args(argv)
+    if not args.filenames:
+        parser.error("the following arguments are required: filenames")
 
     logging.basicConfig()
-    if args.verbose > 0:
-        logger.setLevel(logging.DEBUG)
+    logger.setLevel(logging.DEBUG if args.verbose > 0 else logging.NOTSET)
 
     if args.black:
         try:
@@ -149,10 +240,30 @@ async def async_main(argv: list[str] | None = None) -> int:
             print("Error! Ruff isn't installed")
             return 2
 
+    # Import the tools only if the run isn't forwarded to the daemon
+    from .main import \
+        async_run  # pylint: disable=import-outside-toplevel
+
     return await async_run(args)
 
 
 def main(argv: list[str] | None = None) -> int:
+    argv = argv if argv is not None else sys.argv[1:]
+    args = create_parser().parse_args(argv)
+    # pylint: disable-next=import-outside-toplevel
+    import asyncio
+
+    if args.daemon:
+        if daemon_supported() is False:
+            print("Error! The daemon requires Unix sockets.")
+            return 14
+        return asyncio.run(async_serve(args.daemon_socket or default_socket_path(), async_main))
+    if (
+        args.no_daemon is False
+        and daemon_supported()
+        and (returncode := forward(argv, args.daemon_socket or default_socket_path())) is not None
+    ):
+        return returncode
     return asyncio.run(async_main(argv))
 
 
@@ -0,0 +1,167 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+from __future__ import annotations
+
+import argparse
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT = 2
+CACHE_FILENAME = "results.sqlite"
+# Max seconds to wait for a lock held by another run
+TIMEOUT = 5
+TOOLS = ("python-typing-update", "autoflake", "isort", "pyupgrade", "reorder-python-imports")
+
+
+def default_cache_dir() -> Path:
+    """Return default cache directory."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cache_home, "python-typing-update")
+
+
+@lru_cache
+def _tool_version(name: str) -> str:
+    # pylint: disable-next=import-outside-toplevel
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class ResultCache:
+    """Persistent cache of typing_update results.
+
+    Keyed by the file content hash, the relevant options, the tool configs
+    and the pinned tool versions. Stores either the updated content (before
+    the formatter is run) or None if no update was necessary. Once the cache
+    grows beyond max_size bytes, the least recently used entries are evicted.
+
+    The cache can be shared by concurrent runs. Each result is committed
+    on its own, the access times of cache hits are only written on 'close'.
+    If the database is locked or broken, it's treated as a cache miss.
+    The methods are thread-safe.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int) -> None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits: int = 0
+        self._lock = threading.Lock()
+        self._used: dict[str, float] = {}
+        # Autocommit, transactions are only opened explicitly
+        self._connection = sqlite3.connect(
+            cache_dir / CACHE_FILENAME, timeout=TIMEOUT,
+            isolation_level=None, check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, status INTEGER, content TEXT, "
+            "size INTEGER, last_used REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+        )
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> ResultCache | None:
+        """Open cache selected via args. Return None if disabled or unavailable."""
+        if args.no_cache:
+            return None
+        cache_dir = Path(args.cache_dir) if args.cache_dir else default_cache_dir()
+        try:
+            return cls(cache_dir, args.cache_max_size * 1024 * 1024)
+        except (OSError, sqlite3.Error) as ex:
+            logger.warning("Unable to open cache in %s: %s", cache_dir, ex)
+            return None
+
+    @staticmethod
+    def make_key(filename: str, content: str, args: argparse.Namespace) -> str:
+        """Create cache key for file.
+
+        The formatter isn't part of the key. It runs after the update
+        on all written files, also if the result was cached.
+        """
+        # pylint: disable-next=import-outside-toplevel
+        from .stages import config_fingerprint
+
+        data = json.dumps([
+            CACHE_FORMAT,
+            [(tool, _tool_version(tool)) for tool in TOOLS],
+            args.min_version, args.full_reorder, args.keep_updates,
+            os.path.abspath(filename),
+            config_fingerprint(os.path.dirname(os.path.abspath(filename))),
+            hashlib.sha256(content.encode()).hexdigest(),
+        ])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple[int, str | None] | None:
+        """Return cached status and content. None if key isn't cached."""
+        with self._lock:
+            try:
+                row = self._connection.execute(
+                    "SELECT status, content FROM results WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as ex:
+                logger.debug("Unable to read from cache: %s", ex)
+                return None
+            if row is None:
+                return None
+            self._used[key] = time.time()
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key: str, status: int, content: str | None) -> None:
+        """Store result. Content should be None if the file wasn't updated."""
+        with self._lock:
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, status, content, len(content.encode()) if content else 0, time.time()),
+                )
+            except sqlite3.Error as ex:
+                logger.debug("Unable to write to cache: %s", ex)
+
+    def close(self) -> None:
+        """Save access times, evict least recently used entries and close cache."""
+        with self._lock:
+            try:
+                self._connection.execute("BEGIN IMMEDIATE")
+                try:
+                    self._connection.executemany(
+                        "UPDATE results SET last_used = ? WHERE key = ?",
+                        [(last_used, key) for key, last_used in self._used.items()],
+                    )
+                    total_size = 0
+                    evict: list[tuple[str]] = []
+                    for key, size in self._connection.execute(
+                        "SELECT key, size FROM results ORDER BY last_used DESC, rowid DESC"
+                    ):
+                        # Also count the fixed per entry overhead
+                        total_size += size + 256
+                        if total_size > self.max_size:
+                            evict.append((key,))
+                    self._connection.executemany("DELETE FROM results WHERE key = ?", evict)
+                    self._connection.execute("COMMIT")
+                except sqlite3.Error:
+                    if self._connection.in_transaction:
+                        self._connection.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as ex:
+                logger.debug("Unable to update cache: %s", ex)
+            finally:
+                self._used.clear()
+                self._connection.close()
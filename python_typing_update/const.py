@@ -10,6 +10,16 @@ from typing import NamedTuple
 class FileAttributes(NamedTuple):
     status: FileStatus
     imports: set[str]
+    may_need_update: bool = True
+
+
+class UpdateResult(NamedTuple):
+    """Result of the update stages for a single file."""
+
+    status: int
+    content: str
+    timings: dict[str, float]
+    output: str
 
 
 class FileStatus(Flag):
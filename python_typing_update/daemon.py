@@ -0,0 +1,244 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""Daemon to keep the tools imported between runs.
+
+Only lightweight modules of the standard library are imported
+here, so forwarding a run to the daemon stays cheap.
+"""
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Iterator, Mapping
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import traceback
+from typing import TYPE_CHECKING, Any, TextIO
+
+if TYPE_CHECKING:
+    import asyncio
+
+# Max size of a single request, large enough for the argv of huge file lists
+MAX_REQUEST_SIZE = 2 ** 24
+
+
+def daemon_supported() -> bool:
+    return hasattr(socket, "AF_UNIX") and hasattr(os, "getuid")
+
+
+def default_socket_path() -> str:
+    """Return default path of the daemon socket.
+
+    Use '$XDG_RUNTIME_DIR' if set, otherwise the temp directory.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"python-typing-update-{os.getuid()}.sock")
+
+
+def _code_stamp() -> list[Any]:
+    """Identify the installed code. Client and daemon have to match."""
+    package = os.path.dirname(os.path.abspath(__file__))
+    with os.scandir(package) as it:
+        mtime = max(entry.stat().st_mtime_ns for entry in it if entry.name.endswith(".py"))
+    return [package, mtime]
+
+
+def _encode(message: dict[str, Any]) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+class _ForwardOutput(io.TextIOBase):
+    """Forward writes to client connection."""
+
+    def __init__(self, writer: asyncio.StreamWriter, name: str) -> None:
+        self._writer = writer
+        self._name = name
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: str) -> int:
+        if data and self._writer.is_closing() is False:
+            self._writer.write(_encode({self._name: data}))
+        return len(data)
+
+
+class _StderrHandler(logging.StreamHandler):
+    """Log to the current sys.stderr, which is forwarded to the client during a run."""
+
+    def __init__(self) -> None:  # pylint: disable=super-init-not-called
+        # Like 'logging._StderrHandler', don't store the stream
+        # pylint: disable-next=non-parent-init-called
+        logging.Handler.__init__(self)
+
+    @property
+    def stream(self) -> TextIO:
+        return sys.stderr
+
+
+@contextlib.contextmanager
+def _environ(env: Mapping[str, str]) -> Iterator[None]:
+    """Replace the environment, it's inherited by subprocesses like git or the formatter."""
+    env_orig = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(env_orig)
+
+
+def forward(argv: list[str], path: str) -> int | None:
+    """Forward run to daemon listening on path.
+
+    Output of the run is written to stdout / stderr.
+
+    Returns:
+        None: if no daemon is running or it can't handle the request,
+            nothing was done in that case.
+        14: if the connection was lost during the run
+        otherwise the return code of the run
+    """
+    if daemon_supported() is False:
+        return None
+    try:
+        if os.stat(path).st_uid != os.getuid():
+            # Only trust daemons of the same user
+            return None
+    except OSError:
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            sock.sendall(_encode({
+                "code": _code_stamp(), "cwd": os.getcwd(), "env": dict(os.environ), "argv": argv,
+            }))
+        except OSError:
+            return None
+        with sock.makefile("r", encoding="utf-8") as fp:
+            try:
+                for line in fp:
+                    message = json.loads(line)
+                    if "stdout" in message:
+                        sys.stdout.write(message["stdout"])
+                    elif "stderr" in message:
+                        sys.stderr.write(message["stderr"])
+                    elif "exit" in message:
+                        return int(message["exit"])
+                    elif "reject" in message:
+                        return None
+            except (OSError, ValueError):
+                pass
+    print("Error! Lost connection to the daemon.")
+    return 14
+
+
+def _is_listening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+async def async_serve(path: str, run: Callable[[list[str]], Awaitable[int]]) -> int:
+    """Listen on Unix socket path and run forwarded requests until stopped.
+
+    Requests are run one at a time, each in the working directory and
+    with the environment of the client. Tool configs are kept loaded until one of the config
+    files changes.
+
+    Returns:
+        0: Daemon stopped
+        14: Unable to listen on path
+    """
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    # Import the tools once for all requests
+    from . import stages
+
+    if _is_listening(path):
+        print(f"Error! Daemon already running on '{path}'.")
+        return 14
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+    # Log to the client while a run is handled
+    log_handler = _StderrHandler()
+    log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    logging.getLogger().addHandler(log_handler)
+    lock = asyncio.Lock()
+    code_stamp = _code_stamp()
+    config_stamp = stages.config_stamp()
+
+    async def async_run_request(cwd: str, argv: list[str]) -> int:
+        """Run request, errors are reported to the client like a local run would."""
+        try:
+            os.chdir(cwd)
+            return await run(argv)
+        except SystemExit as ex:
+            return ex.code if isinstance(ex.code, int) else 2
+        except Exception:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+            return 1
+
+    async def handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonlocal config_stamp
+        try:
+            try:
+                request = json.loads(await reader.readline())
+                code, cwd, env, argv = request["code"], request["cwd"], request["env"], request["argv"]
+            except (OSError, ValueError, KeyError, TypeError):
+                # -> Not a valid request
+                return
+            if code != code_stamp:
+                writer.write(_encode({"reject": "code"}))
+                return
+            async with lock:
+                if stages.config_stamp() != config_stamp:
+                    stages.clear_config_caches()
+                cwd_daemon = os.getcwd()
+                try:
+                    with _environ(env), \
+                            contextlib.redirect_stdout(_ForwardOutput(writer, "stdout")), \
+                            contextlib.redirect_stderr(_ForwardOutput(writer, "stderr")):
+                        returncode = await async_run_request(cwd, argv)
+                finally:
+                    os.chdir(cwd_daemon)
+                    config_stamp = stages.config_stamp()
+            writer.write(_encode({"exit": returncode}))
+            await writer.drain()
+        except OSError:
+            # -> Client disconnected
+            pass
+        finally:
+            writer.close()
+
+    # Only accessible by the user, already when the socket is created
+    umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle_request, path, limit=MAX_REQUEST_SIZE)
+    finally:
+        os.umask(umask)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    print(f"Daemon listening on '{path}'.", flush=True)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+        logging.getLogger().removeHandler(log_handler)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+    return 0
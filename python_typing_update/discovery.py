@@ -0,0 +1,310 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator, Iterable
+import itertools
+import os
+import re
+from typing import NamedTuple
+
+RE_GLOB_MAGIC = re.compile(r"[*?[]")
+VCS_DIRECTORIES = frozenset({".git", ".hg", ".svn"})
+
+
+def is_glob(pattern: str) -> bool:
+    return RE_GLOB_MAGIC.search(pattern) is not None
+
+
+def _translate(pattern: str) -> str:
+    """Translate gitignore pattern to regex."""
+    result: list[str] = []
+    i, length = 0, len(pattern)
+    while i < length:
+        if pattern.startswith("**/", i):
+            result.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            result.append(".*")
+            i += 2
+            continue
+        char = pattern[i]
+        i += 1
+        if char == "*":
+            result.append("[^/]*")
+        elif char == "?":
+            result.append("[^/]")
+        elif char == "[" and (end := pattern.find("]", i + 1)) != -1:
+            chars = pattern[i:end]
+            if chars[0] == "!":
+                chars = "^" + chars[1:]
+            result.append(f"[{chars.replace(chr(92), chr(92) * 2)}]")
+            i = end + 1
+        elif char == "\\" and i < length:
+            result.append(re.escape(pattern[i]))
+            i += 1
+        else:
+            result.append(re.escape(char))
+    return "".join(result)
+
+
+class IgnoreRule(NamedTuple):
+    """Single gitignore pattern, relative to base directory (with trailing separator)."""
+
+    base: str
+    regex: re.Pattern[str]
+    negate: bool
+    dir_only: bool
+
+    @classmethod
+    def from_pattern(cls, directory: str, pattern: str) -> IgnoreRule | None:
+        """Parse line of a gitignore file.
+
+        Return None for comments, blank lines and invalid patterns.
+        """
+        pattern = pattern.rstrip("\n").rstrip(" ")
+        if not pattern or pattern.startswith("#"):
+            return None
+        if negate := pattern.startswith("!"):
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        if not (pattern := pattern.rstrip("/")):
+            return None
+        regex = _translate(pattern.lstrip("/"))
+        if "/" not in pattern:
+            # Match name at any depth
+            regex = "(?:.*/)?" + regex
+        try:
+            return cls(os.path.join(directory, ""), re.compile(regex), negate, dir_only)
+        except re.error:
+            return None
+
+    def match(self, path: str, is_dir: bool) -> bool:
+        """Match absolute path."""
+        if self.dir_only and not is_dir or not path.startswith(self.base):
+            return False
+        relative = path[len(self.base):].replace(os.sep, "/")
+        return self.regex.fullmatch(relative) is not None
+
+
+def _read_gitignore(directory: str) -> tuple[IgnoreRule, ...]:
+    try:
+        with open(os.path.join(directory, ".gitignore"), encoding="utf-8") as fp:
+            return tuple(
+                rule for line in fp
+                if (rule := IgnoreRule.from_pattern(directory, line)) is not None
+            )
+    except OSError:
+        return ()
+
+
+class IgnoreRules(NamedTuple):
+    """gitignore rules of a directory and all its parents, plus exclude patterns.
+
+    The last matching rule decides. Exclude patterns are checked after
+    all gitignore rules and can't be negated by them.
+    """
+
+    gitignore: tuple[IgnoreRule, ...]
+    exclude: tuple[IgnoreRule, ...]
+
+    @classmethod
+    def for_directory(cls, directory: str, exclude: tuple[IgnoreRule, ...]) -> IgnoreRules:
+        """Collect rules of all .gitignore files from the git root down to directory."""
+        directories: list[str] = []
+        current = directory
+        while True:
+            directories.append(current)
+            if os.path.exists(os.path.join(current, ".git")):
+                break
+            if (parent := os.path.dirname(current)) == current:
+                # -> Not in a git repo, only use .gitignore of directory itself
+                directories = [directory]
+                break
+            current = parent
+        rules = tuple(rule for dir_ in reversed(directories) for rule in _read_gitignore(dir_))
+        return cls(rules, exclude)
+
+    def child(self, directory: str) -> IgnoreRules:
+        """Return rules for subdirectory."""
+        if rules := _read_gitignore(directory):
+            return IgnoreRules(self.gitignore + rules, self.exclude)
+        return self
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        ignored = False
+        for rule in self.gitignore:
+            if rule.match(path, is_dir):
+                ignored = not rule.negate
+        for rule in self.exclude:
+            if rule.match(path, is_dir):
+                ignored = not rule.negate
+        return ignored
+
+
+class _Directory(NamedTuple):
+    """Directory to walk.
+
+    If pattern is set, only files matching it are yielded. All files
+    in subdirectories matching pattern are yielded, too. Other
+    subdirectories are only walked if they match pattern_prefix.
+    """
+
+    path: str
+    abspath: str
+    rules: IgnoreRules
+    pattern: re.Pattern[str] | None
+    pattern_prefix: re.Pattern[str] | None = None
+
+
+def _split_glob(pattern: str) -> tuple[str, re.Pattern[str], re.Pattern[str] | None]:
+    """Split glob pattern into the base directory without magic and regex for the full path.
+
+    Also return a regex for directories which could contain a match,
+    any directory below a '**' part. None if only the base directory can.
+    """
+    pattern = os.path.normpath(pattern)
+    parts = pattern.split(os.sep)
+    base_parts = list(itertools.takewhile(lambda part: not is_glob(part), parts))
+    base = os.sep if base_parts == [""] else os.sep.join(base_parts)
+    prefixes = [
+        _translate("/".join(parts[:index]))
+        for index in range(len(base_parts) + 1, len(parts))
+    ]
+    return (
+        base,
+        re.compile(_translate("/".join(parts))),
+        re.compile("|".join(prefixes)) if prefixes else None,
+    )
+
+
+def _scan_directory(directory: _Directory) -> tuple[list[str], list[_Directory]]:
+    """List '.py' files and subdirectories which aren't ignored."""
+    files: list[str] = []
+    directories: list[_Directory] = []
+    with os.scandir(directory.abspath) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        path = os.path.join(directory.path, entry.name)
+        abspath = os.path.join(directory.abspath, entry.name)
+        pattern = directory.pattern
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name in VCS_DIRECTORIES or directory.rules.is_ignored(abspath, True):
+                continue
+            if pattern is not None:
+                if pattern.fullmatch(path.replace(os.sep, "/")):
+                    # -> Directory matches glob pattern, include all files
+                    pattern = None
+                elif (
+                    directory.pattern_prefix is None
+                    or not directory.pattern_prefix.fullmatch(path.replace(os.sep, "/"))
+                ):
+                    # -> Can't contain any match
+                    continue
+            directories.append(_Directory(
+                path, abspath, directory.rules.child(abspath), pattern, directory.pattern_prefix))
+        elif (
+            entry.name.endswith(".py")
+            and entry.is_file()
+            and not directory.rules.is_ignored(abspath, False)
+            and (pattern is None or pattern.fullmatch(path.replace(os.sep, "/")))
+        ):
+            files.append(path)
+    return files, directories
+
+
+async def async_discover_files(
+    inputs: Iterable[str],
+    exclude: Iterable[str] = (), *,
+    num_workers: int,
+) -> AsyncIterator[str]:
+    """Discover files from filenames, directories and glob patterns.
+
+    Filenames are yielded as is. Directories are walked with 'num_workers'
+    concurrent 'os.scandir' calls and only '.py' files are yielded.
+    Paths ignored by '.gitignore' or matching one of the exclude patterns
+    (gitignore syntax, relative to the current working directory) are
+    skipped. Glob patterns are expanded by walking their base directory,
+    '**' matches any number of subdirectories. Each file is yielded
+    only once. Files are yielded as soon as they are found, the order
+    for walked directories isn't deterministic.
+    """
+    inputs = list(inputs)
+    loop = asyncio.get_running_loop()
+    cwd = os.getcwd()
+    exclude_rules = tuple(
+        rule for pattern in exclude
+        if (rule := IgnoreRule.from_pattern(cwd, pattern)) is not None
+    )
+    files: asyncio.Queue[str | None] = asyncio.Queue(maxsize=max(num_workers, 1))
+    directories: asyncio.Queue[_Directory] = asyncio.Queue()
+    # Walks don't follow symlinks, only multiple inputs can overlap
+    seen: set[str] | None = set() if len(inputs) > 1 else None
+    error: Exception | None = None
+
+    async def add_directory(
+        path: str,
+        pattern: re.Pattern[str] | None = None,
+        pattern_prefix: re.Pattern[str] | None = None,
+    ) -> None:
+        abspath = os.path.abspath(path or os.curdir)
+        rules = await loop.run_in_executor(
+            None, IgnoreRules.for_directory, abspath, exclude_rules)
+        await directories.put(_Directory(path, abspath, rules, pattern, pattern_prefix))
+
+    async def walk_worker() -> None:
+        while True:
+            directory = await directories.get()
+            try:
+                files_found, subdirectories = await loop.run_in_executor(
+                    None, _scan_directory, directory)
+                for file_ in files_found:
+                    await files.put(file_)
+                for subdirectory in subdirectories:
+                    await directories.put(subdirectory)
+            except OSError:
+                pass
+            finally:
+                directories.task_done()
+
+    async def input_stage() -> None:
+        for input_ in inputs:
+            if is_glob(input_) and not os.path.lexists(input_):
+                base, pattern, pattern_prefix = _split_glob(input_)
+                if os.path.isdir(base or os.curdir):
+                    await add_directory(base, pattern, pattern_prefix)
+            elif os.path.isdir(input_):
+                await add_directory("" if os.path.normpath(input_) == os.curdir else input_)
+            else:
+                await files.put(input_)
+        await directories.join()
+
+    async def input_stage_wrapper() -> None:
+        nonlocal error
+        try:
+            await input_stage()
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            error = ex
+        # Signal end of discovery
+        await files.put(None)
+
+    tasks = [
+        asyncio.ensure_future(input_stage_wrapper()),
+        *(asyncio.ensure_future(walk_worker()) for _ in range(max(num_workers, 1))),
+    ]
+    try:
+        while (file_ := await files.get()) is not None:
+            if seen is not None:
+                key = os.path.normcase(os.path.abspath(file_))
+                if key in seen:
+                    continue
+                seen.add(key)
+            yield file_
+        if error is not None:
+            raise error
+    finally:
+        for task in tasks:
+            task.cancel()
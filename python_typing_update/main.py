@@ -5,111 +5,227 @@ from __future__ import annotations
 
 import argparse
 import asyncio
-import builtins
-from collections.abc import Iterable
-from functools import partial
+from collections.abc import AsyncIterable, Iterable
+from concurrent.futures import Executor
 import io
-from io import StringIO
 import logging
+from typing import TYPE_CHECKING, NamedTuple
 
 import aiofiles
-from autoflake import _main as autoflake_main
-from isort.main import main as isort_main
-from pyupgrade._main import main as pyupgrade_main
-import reorder_python_imports
 
-from .const import FileAttributes, FileStatus
+from .cache import ResultCache
+from .const import FileAttributes, FileStatus, UpdateResult
+from .discovery import async_discover_files
+from .profiling import StageProfile
+from .report import (
+    STATUS_COMMENT, STATUS_IMPORTS_CHANGED, STATUS_NO_CHANGES,
+    STATUS_PREFILTERED, STATUS_RESTORED, STATUS_SKIPPED, STATUS_UPDATED,
+    RunReport)
+from .summary import (
+    RunSummary, SummaryOptions, print_summary, write_summary_json)
 from .utils import (
+    abs_path, analyze_file, analyze_imports, async_changed_files,
     async_check_uncommitted_changes, async_restore_files,
-    check_comment_between_imports, check_files_exist, extract_imports)
+    async_run_formatter, check_files_exist, in_shard, unified_diff)
+
+if TYPE_CHECKING:
+    from multiprocessing.context import BaseContext
 
 logger = logging.getLogger("typing-update")
 
 
+class UncommittedChangesError(Exception):
+    """Files which should be updated have uncommitted changes."""
+
+
+def init_worker(min_version: tuple[int, ...]) -> None:
+    """Initialize worker process.
+
+    The tools are imported lazily, only once a file is updated.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from .stages import init_worker as _init_worker
+    _init_worker(min_version)
+
+
+def update_content(
+    filename: str,
+    content: str,
+    args: argparse.Namespace,
+    file_status: FileStatus,
+) -> UpdateResult:
+    """Run all in-memory update stages, see 'stages.update_content'."""
+    # pylint: disable-next=import-outside-toplevel
+    from .stages import update_content as _update_content
+    return _update_content(filename, content, args, file_status)
+
+
+class PipelineResult(NamedTuple):
+    num_files: int
+    num_no_changes: int
+    num_prefiltered: int
+    # Attributes of updated files (in input order)
+    files_updated: dict[str, FileAttributes]
+    # Updated files which need a manual update and weren't written
+    files_not_written: set[str]
+    # '--limit': stopped before all files were processed
+    limit_reached: bool = False
+
+
+def _imports_changed(imports: set[str], imports_updated: set[str]) -> bool:
+    """Check if any import, other than from typing, was removed."""
+    return any(
+        not import_.startswith('typing')
+        for import_ in imports.difference(imports_updated)
+    )
+
+
+def _needs_manual_update(attrs: FileAttributes, imports_updated: set[str]) -> bool:
+    return FileStatus.COMMENT in attrs.status or _imports_changed(attrs.imports, imports_updated)
+
+
+def _report_status(attrs: FileAttributes, imports_updated: set[str]) -> str:
+    """Return report status of an updated file."""
+    if FileStatus.COMMENT in attrs.status:
+        return STATUS_COMMENT
+    if _imports_changed(attrs.imports, imports_updated):
+        return STATUS_IMPORTS_CHANGED
+    return STATUS_UPDATED
+
+
 async def typing_update(
     loop: asyncio.AbstractEventLoop,
+    executor: Executor | None,
     filename: str,
     args: argparse.Namespace,
-    file_status: FileStatus,
+    attrs: FileAttributes, *,
+    snapshot: dict[str, str],
+    imports_updated: dict[str, set[str]],
+    cache: ResultCache | None,
+    profile: StageProfile,
+    committed_check: asyncio.Future[bool] | None,
 ) -> tuple[int, str]:
     """Update typing syntax.
 
+    The file is read once, all stages operate on the in-memory content
+    and the result is written at most once. The CPU-bound stages run
+    in executor, if None in the default thread pool. The original content
+    of updated files is saved in snapshot if it might need to be restored,
+    the imports of the updated content in imports_updated. Files which
+    need a manual update aren't written, unless forced.
+    If the result is already cached, the update stages are skipped.
+    The wall time of each stage is recorded in profile.
+    The update only starts once the committed_check passed, so the tools
+    aren't imported if it fails.
+    With '--check' and '--diff', the file is never written. Instead
+    '--diff' prints the changes, unless the file needs a manual update.
+
     Returns:
-        - 0, filename: file was updated
+        - 0, filename: file was updated (or would be with '--check')
+        - 1, filename: file needs a manual update, it wasn't written
         - 2, filename: if not typing update is necessary
     """
-    null_file = StringIO()
-    autoflake_partial: partial[int] = partial(
-        autoflake_main, standard_out=null_file, standard_error=null_file
-    )
-    version_string = f"--py{''.join(map(str, args.min_version))}-plus"
-
-    # Add, replace and reorder imports
-    reorder_args: list[str] = []
-    if args.full_reorder:
-        reorder_args.append(version_string)
-    reorder_args.append(filename)
-    await loop.run_in_executor(
-        None, reorder_python_imports.main,
-        reorder_args,
-    )
-
-    # Run pyupgrade
-    status_pyupgrade = await loop.run_in_executor(
-        None, pyupgrade_main,
-        [version_string, filename]
-    )
-    if status_pyupgrade == 0 and not args.full_reorder:
-        # -> No updates made, revert changes
+    with profile.measure("read", filename):
+        async with aiofiles.open(filename, encoding="utf-8", newline="") as fp:
+            content_orig = await fp.read()
+
+    if committed_check is not None and (await committed_check) is False:
+        raise UncommittedChangesError
+
+    cache_key: str | None = None
+    cache_result: tuple[int, str | None] | None = None
+    if cache is not None:
+        with profile.measure("cache", filename):
+            cache_key = cache.make_key(filename, content_orig, args)
+            # Don't block the event loop if another run holds the lock
+            cache_result = await loop.run_in_executor(None, cache.get, cache_key)
+    if cache_result is not None:
+        status, content_cached = cache_result
+        content = content_orig if content_cached is None else content_cached
+    else:
+        result = await loop.run_in_executor(
+            executor, update_content,
+            filename, content_orig, args, attrs.status,
+        )
+        status, content = result.status, result.content
+        profile.add_all(result.timings, filename)
+        if result.output:
+            logger.debug("Output for %s:\n%s", filename, result.output.rstrip())
+        if cache is not None and cache_key is not None:
+            await loop.run_in_executor(None, cache.set, cache_key, status, content if status == 0 else None)
+
+    if status == 2:
+        # -> No updates necessary, file wasn't modified
         return 2, filename
+    imports = imports_updated[filename] = analyze_imports(io.StringIO(content))[1]
+    if args.check is True:
+        # -> Read-only, only report file
+        return 0, filename
+
+    needs_manual_update = _needs_manual_update(attrs, imports)
+    if args.diff is True:
+        if content != content_orig and not needs_manual_update:
+            # Stream diff as soon as the file is done
+            print(unified_diff(filename, content_orig, content), end="", flush=True)
+        return 0, filename
+    forced = args.force or args.only_force
+    if needs_manual_update and not forced:
+        # -> Would be restored anyway
+        return 1, filename
+
+    if args.limit > 0 or args.ruff and not forced:
+        # Might be restored later. The formatter might modify
+        # the file even if content is unchanged.
+        snapshot[filename] = content_orig
+    if content != content_orig:
+        with profile.measure("write", filename):
+            async with aiofiles.open(filename, "w", encoding="utf-8", newline="") as fp:
+                await fp.write(content)
 
-    # Check for unused imports (autoflake)
-    status_autoflake = await loop.run_in_executor(
-        None, autoflake_partial,
-        [None, '-c', filename],
-    )
-    if (
-        status_autoflake == 0
-        and args.keep_updates is False
-        and args.full_reorder is False
-        and FileStatus.COMMENT_TYPING not in file_status
-    ):
-        # -> No unused imports, revert changes
-        return 2, filename
+    return 0, filename
 
-    # Remove unused imports (autoflake)
-    await loop.run_in_executor(
-        None, autoflake_partial,
-        [None, '-i', filename],
+
+def create_executor(args: argparse.Namespace) -> Executor | None:
+    """Create process pool to run the update stages.
+
+    Return None for '--jobs 1' to run them in the default thread pool instead.
+    """
+    if args.jobs <= 1:
+        return None
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    mp_context: BaseContext
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        # Workers are forked from a server process which has already imported the tools
+        mp_context = multiprocessing.get_context("forkserver")
+        mp_context.set_forkserver_preload([f"{__package__}.stages"])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(
+        max_workers=args.jobs,
+        mp_context=mp_context,
+        initializer=init_worker,
+        initargs=(args.min_version,),
     )
 
-    # Run isort
-    try:
-        await loop.run_in_executor(
-            None, isort_main,
-            [filename],
-        )
-    except SystemExit:
-        pass
-
-    # Run black
-    if args.black:
-        process = await asyncio.create_subprocess_shell(
-            f"black {filename}",
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        await process.communicate()
-    elif args.ruff:
-        process = await asyncio.create_subprocess_shell(
-            f"ruff check --force-exclude --fix {filename} && "
-            f"ruff format --force-exclude {filename}",
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        await process.communicate()
 
-    return 0, filename
+async def async_load_file(
+    args: argparse.Namespace,
+    filename: str, *,
+    check_comments: bool,
+) -> FileAttributes:
+    """Perform token analysis and pre-filter in the default thread pool.
+
+    The file isn't loaded into memory, only the main import block is read.
+    """
+    loop = asyncio.get_running_loop()
+    file_status, imports_set, may_need_update = await loop.run_in_executor(
+        None, analyze_file, filename, args.min_version)
+    if check_comments is False:
+        file_status = FileStatus.CLEAR
+    return FileAttributes(file_status, imports_set, may_need_update)
 
 
 async def async_load_files(
@@ -117,30 +233,185 @@ async def async_load_files(
     filenames: Iterable[str], *,
     check_comments: bool,
 ) -> dict[str, FileAttributes]:
-    """Process files from file list."""
-    active_tasks: int = 0
-
-    async def async_load_file(filename: str) -> tuple[str, FileAttributes]:
-        """Load file into memory and perform token analysis."""
-        nonlocal active_tasks
-        while active_tasks > args.concurrent_files:
-            await asyncio.sleep(0)
-        active_tasks += 1
-        async with aiofiles.open(filename, encoding="utf-8") as fp:
-            data = await fp.read()
-        file_status = check_comment_between_imports(io.StringIO(data)) \
-            if check_comments is True else FileStatus.CLEAR
-        imports_set = extract_imports(io.StringIO(data))
-        active_tasks -= 1
-        return filename, FileAttributes(file_status, imports_set)
-
-    results = await asyncio.gather(*(async_load_file(file_) for file_ in filenames))
-    return dict(results)
+    """Process files from file list.
+
+    A fixed number of workers ('--concurrent-files') pull the filenames
+    from a shared iterator. Memory usage therefore doesn't grow with
+    the number of files waiting to be loaded.
+    """
+    results: dict[int, tuple[str, FileAttributes]] = {}
+    filenames_iter = enumerate(filenames)
+
+    async def async_load_worker() -> None:
+        for index, filename in filenames_iter:
+            results[index] = filename, await async_load_file(
+                args, filename, check_comments=check_comments)
+
+    await asyncio.gather(*(async_load_worker() for _ in range(max(args.concurrent_files, 1))))
+    # Restore input order
+    return dict(results[index] for index in sorted(results))
+
+
+async def async_process_files(
+    args: argparse.Namespace,
+    filenames: AsyncIterable[str],
+    executor: Executor | None, *,
+    snapshot: dict[str, str],
+    imports_updated: dict[str, set[str]],
+    cache: ResultCache | None,
+    profile: StageProfile,
+    committed_check: asyncio.Future[bool] | None,
+    report: RunReport | None = None,
+) -> PipelineResult:
+    """Load, analyze and update files as one streaming pipeline.
+
+    Each stage runs '--concurrent-files' workers. Filenames are loaded
+    as soon as they are discovered. Files are passed from the load stage
+    to the update stage through a bounded queue as soon as they have
+    been analyzed. If the update stage falls behind, loading
+    is paused until it catches up. Files which can't contain any typing
+    update are skipped. Files are loaded while the committed_check runs,
+    the update stage waits for it. If it fails, the pipeline is stopped
+    with UncommittedChangesError before any file is updated.
+    Each file is added to report as soon as it's done.
+
+    Only updated files are kept once they reach their final status,
+    all others are just counted. Memory usage therefore doesn't grow
+    with the number of files which don't need an update.
+
+    With '--limit', no new files are started once one more file than
+    the limit needed an update, for the files done in input order.
+    That one is only updated to tell if the limit applied. Files already
+    in progress still finish, so more than limit files might be updated.
+    """
+    loop = asyncio.get_running_loop()
+    num_workers = max(args.concurrent_files, 1)
+    queue_load: asyncio.Queue[tuple[int, str] | None] = asyncio.Queue(maxsize=num_workers)
+    queue: asyncio.Queue[tuple[int, str, FileAttributes] | None] = asyncio.Queue(maxsize=num_workers)
+    files_updated: dict[int, tuple[str, FileAttributes]] = {}
+    files_not_written: set[str] = set()
+    num_files = num_no_changes = num_prefiltered = 0
+    # '--limit': all files before index_done are done
+    index_done = num_updated_done = 0
+    indices_done: set[int] = set()
+    limit_reached = False
+    # Files without typing syntax can still be rewritten by pyupgrade. That only
+    # changes the result of the modes which write or report those files.
+    use_prefilter = (
+        args.no_prefilter is False
+        and args.full_reorder is False
+        and args.keep_updates is False
+        and args.check is False
+        and args.force is False
+        and args.only_force is False
+    )
+
+    def file_done(index: int, filename: str, status: str, attrs: FileAttributes) -> None:
+        nonlocal num_files, index_done, num_updated_done, limit_reached
+        if status != STATUS_SKIPPED:
+            # Files skipped with '--only-force' aren't processed
+            num_files += 1
+        if report is not None:
+            report.add_file(
+                filename, status, attrs.status,
+                attrs.imports.difference(imports_updated[filename]) if filename in imports_updated else (),
+                profile.pop_file(filename),
+            )
+        if args.limit <= 0:
+            return
+        indices_done.add(index)
+        while index_done in indices_done:
+            indices_done.remove(index_done)
+            if index_done in files_updated:
+                num_updated_done += 1
+            index_done += 1
+        if num_updated_done > args.limit:
+            limit_reached = True
+
+    async def async_discover_stage() -> None:
+        index = 0
+        async for filename in filenames:
+            if limit_reached:
+                break
+            await queue_load.put((index, filename))
+            index += 1
+        for _ in range(num_workers):
+            # Signal end of input to load workers
+            await queue_load.put(None)
+
+    async def async_load_worker() -> None:
+        nonlocal num_no_changes, num_prefiltered
+        while (item := await queue_load.get()) is not None:
+            if limit_reached:
+                continue
+            index, filename = item
+            with profile.measure("load", filename):
+                attrs = await async_load_file(args, filename, check_comments=True)
+            if args.only_force and attrs.status == FileStatus.CLEAR:
+                file_done(index, filename, STATUS_SKIPPED, attrs)
+                continue
+            if use_prefilter and attrs.may_need_update is False:
+                # -> No typing syntax which could be updated
+                num_no_changes += 1
+                num_prefiltered += 1
+                file_done(index, filename, STATUS_PREFILTERED, attrs)
+                continue
+            await queue.put((index, filename, attrs))
+
+    async def async_load_stage() -> None:
+        await asyncio.gather(*(async_load_worker() for _ in range(num_workers)))
+        for _ in range(num_workers):
+            # Signal end of input to update workers
+            await queue.put(None)
+
+    async def async_update_worker() -> None:
+        nonlocal num_no_changes
+        while (item := await queue.get()) is not None:
+            if limit_reached:
+                continue
+            index, filename, attrs = item
+            status, _ = await typing_update(
+                loop, executor, filename, args, attrs,
+                snapshot=snapshot, imports_updated=imports_updated, cache=cache,
+                profile=profile, committed_check=committed_check)
+            if status == 2:
+                num_no_changes += 1
+                file_done(index, filename, STATUS_NO_CHANGES, attrs)
+                continue
+            files_updated[index] = filename, attrs
+            if status == 1:
+                files_not_written.add(filename)
+            file_done(index, filename, _report_status(attrs, imports_updated[filename]), attrs)
+
+    async def async_committed_check_stage() -> None:
+        if committed_check is not None and (await committed_check) is False:
+            raise UncommittedChangesError
+
+    tasks = [
+        asyncio.ensure_future(async_committed_check_stage()),
+        asyncio.ensure_future(async_discover_stage()),
+        asyncio.ensure_future(async_load_stage()),
+        *(asyncio.ensure_future(async_update_worker()) for _ in range(num_workers)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return PipelineResult(
+        num_files, num_no_changes, num_prefiltered,
+        dict(files_updated[index] for index in sorted(files_updated)),
+        files_not_written, limit_reached,
+    )
 
 
 async def async_run(args: argparse.Namespace) -> int:
     """Update Python typing syntax.
 
+    With '--profile-stages' or '--profile-json', the wall time
+    per phase, stage and file is reported at the end.
+
     Returns:
         0: Files updated or check passed
         1: Check did not pass, files would be updated
@@ -148,109 +419,166 @@ async def async_run(args: argparse.Namespace) -> int:
         10: At least one file doesn't exist
         11: Uncommitted changes in '.py' files
         12: Debug mode
+        13: Unable to determine changed files for '--since'
     """
+    profile = StageProfile(
+        enabled=args.profile_stages or bool(args.profile_json),
+        per_file=bool(args.report_json),
+    )
+    report = RunReport(args.report_json) if args.report_json else None
+    totals: dict[str, int] | None = None
+    try:
+        options = SummaryOptions.from_args(args)
+        result = await _async_run(args, profile, report)
+        summary: RunSummary | None = None
+        if isinstance(result, int):
+            # Aborted
+            returncode = result
+        else:
+            summary = result
+            returncode = print_summary(summary, options)
+        if args.summary_json:
+            write_summary_json(args.summary_json, options, returncode, summary, args.shard)
+        totals = {"returncode": returncode}
+        if summary is not None:
+            totals.update(
+                num_files=summary.num_files,
+                num_no_changes=summary.num_no_changes,
+                num_prefiltered=summary.num_prefiltered,
+                num_updated=len(summary.files_updated),
+                num_no_automatic_update=len(summary.files_no_automatic_update),
+            )
+        return returncode
+    finally:
+        if report is not None:
+            report.close(totals)
+        if args.profile_stages:
+            profile.print_report()
+        if args.profile_json:
+            profile.write_json(args.profile_json)
+
+
+async def _async_run(
+    args: argparse.Namespace,
+    profile: StageProfile,
+    report: RunReport | None,
+) -> RunSummary | int:
+    """Run the update, return the summary or the return code if aborted."""
     if file_errors := check_files_exist(args.filenames):
         print("Abort! Some filenames don't exist.")
         for file_ in file_errors:
             print(f" - {file_}")
         return 10
 
-    if args.disable_committed_check is False \
-            and await async_check_uncommitted_changes(args.filenames) is False:
+    files_changed: set[str] | None = None
+    if args.since:
+        with profile.measure_phase("since"):
+            files_changed = await async_changed_files(args.since)
+        if files_changed is None:
+            print(f"Abort! Unable to determine changed files since '{args.since}'.")
+            return 13
+
+    async def async_committed_check() -> bool:
+        with profile.measure_phase("committed-check"):
+            return await async_check_uncommitted_changes(args.filenames)
+
+    # Run concurrently with the load stage, files are only written once it passed.
+    # Not necessary for '--check' and '--diff' which never write.
+    committed_check: asyncio.Future[bool] | None = None
+    if args.disable_committed_check is False and args.check is False and args.diff is False:
+        committed_check = asyncio.ensure_future(async_committed_check())
+
+    # Original content of modified files which might need to be restored
+    snapshot: dict[str, str] = {}
+    imports_updated: dict[str, set[str]] = {}
+    cache = ResultCache.from_args(args)
+    executor = create_executor(args)
+    filenames_iter = async_discover_files(
+        args.filenames, args.exclude, num_workers=args.concurrent_files)
+    if files_changed is not None:
+        # Only process files changed since ref, unchanged ones are never opened
+        filenames_iter = (
+            file_ async for file_ in filenames_iter
+            if abs_path(file_) in files_changed
+        )
+    if args.shard is not None:
+        filenames_iter = (file_ async for file_ in filenames_iter if in_shard(file_, *args.shard))
+    uncommitted_changes = False
+    try:
+        with profile.measure_phase("pipeline"):
+            result = await async_process_files(
+                args, filenames_iter, executor,
+                snapshot=snapshot, imports_updated=imports_updated, cache=cache,
+                profile=profile, committed_check=committed_check, report=report)
+    except UncommittedChangesError:
+        uncommitted_changes = True
+    finally:
+        if committed_check is not None:
+            committed_check.cancel()
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            await asyncio.get_running_loop().run_in_executor(None, cache.close)
+
+    if uncommitted_changes:
         print("Abort! Commit all changes to '.py' files before running again.")
         return 11
 
-    filenames: dict[str, FileAttributes] = await async_load_files(args, args.filenames, check_comments=True)
-
-    if args.only_force:
-        filenames = {filename: attrs for filename, attrs in filenames.items()
-                     if attrs.status != FileStatus.CLEAR}
-
-    loop = asyncio.get_running_loop()
-    files_updated: list[str] = []
-    files_no_changes: list[str] = []
-
-    # Mock builtin print to omit output
-    original_print = builtins.print
-    builtins.print = lambda *args, **kwargs: None
-
-    return_values = await asyncio.gather(
-        *(typing_update(loop, filename, args, attrs.status) for filename, attrs in filenames.items()))
-    for status, filename in return_values:
-        if status == 0:
-            files_updated.append(filename)
-        elif status == 2:
-            files_no_changes.append(filename)
-
-    builtins.print = original_print
-    await async_restore_files(files_no_changes)
-
+    attrs_updated = result.files_updated
+    files_updated = list(attrs_updated)
     if args.limit > 0 and len(files_updated) > args.limit:
-        print(
-            f"Limit applied! Only updated the first {args.limit} "
-            f"of {len(files_updated)} files")
-        await async_restore_files(files_updated[args.limit:])
+        # If stopped early, more files might need an update
+        num_files_updated = f"at least {len(files_updated)}" if result.limit_reached else len(files_updated)
+        print(f"Limit applied! Only updated the first {args.limit} of {num_files_updated} files")
+        # Files which were still in progress
+        with profile.measure_phase("restore"):
+            await async_restore_files(snapshot, files_updated[args.limit:])
         files_updated = files_updated[:args.limit]
 
+    if args.check is False and args.diff is False:
+        files_written = [file_ for file_ in files_updated if file_ not in result.files_not_written]
+        with profile.measure_phase("formatter"):
+            if args.black:
+                await async_run_formatter(["black", "--quiet"], files_written)
+            elif args.ruff:
+                await async_run_formatter(["ruff", "check", "--force-exclude", "--fix", "--quiet"], files_written)
+                await async_run_formatter(["ruff", "format", "--force-exclude", "--quiet"], files_written)
+        if args.ruff:
+            # 'ruff check --fix' might have removed imports, reload the formatted files
+            with profile.measure_phase("import-check"):
+                files_formatted = await async_load_files(args, files_written, check_comments=False)
+            for file_, attrs in files_formatted.items():
+                imports_updated[file_] = attrs.imports
+
+    if report is not None:
+        files_restored = set(attrs_updated).difference(files_updated)
+        for file_, attrs in attrs_updated.items():
+            report.update_file(
+                file_,
+                STATUS_RESTORED if file_ in files_restored else _report_status(attrs, imports_updated[file_]),
+                attrs.imports.difference(imports_updated[file_]),
+            )
+
     if args.check is True:
-        await async_restore_files(files_updated)
-        if files_updated:
-            print("The following files need to be updated:")
-            for file_ in sorted(files_updated):
-                print(f" - {file_}")
-            return 1
-        return 0
-
-    files_updated_set: set[str] = set(files_updated)
-    files_with_comments = sorted(
-        filename for filename, attrs in filenames.items()
-        if FileStatus.COMMENT in attrs.status and filename in files_updated_set
+        return RunSummary(
+            result.num_files, result.num_no_changes, result.num_prefiltered,
+            sorted(files_updated), [], [],
+        )
+
+    summary = RunSummary(
+        result.num_files, result.num_no_changes, result.num_prefiltered,
+        sorted(files_updated),
+        files_with_comments=sorted(
+            file_ for file_ in files_updated
+            if FileStatus.COMMENT in attrs_updated[file_].status
+        ),
+        files_imports_changed=sorted(
+            file_ for file_ in files_updated
+            if _imports_changed(attrs_updated[file_].imports, imports_updated[file_])
+        ),
     )
-    files_imports_changed: list[str] = []
-    for file_, attrs in (await async_load_files(args, files_updated_set, check_comments=False)).items():
-        import_diff = filenames[file_].imports.difference(attrs.imports)
-        for import_ in import_diff:
-            if not import_.startswith('typing'):
-                files_imports_changed.append(file_)
-                break
-    files_imports_changed = sorted(files_imports_changed)
-    files_no_automatic_update = set(files_with_comments + files_imports_changed)
-
-    if files_no_automatic_update:
-        if args.force or args.only_force:
-            print("Force mode selected!")
-            print("Make sure to double check:")
-            for file_ in files_with_comments:
-                print(f" - {file_}")
-            if files_with_comments and files_imports_changed:
-                print(" --")
-            for file_ in files_imports_changed:
-                print(f" - {file_}")
-        else:
-            print("Could not update all files, check:")
-            for file_ in files_with_comments:
-                print(f" - {file_}")
-            if files_with_comments and files_imports_changed:
-                print(" --")
-            for file_ in files_imports_changed:
-                print(f" - {file_}")
-            await async_restore_files(files_no_automatic_update)
-
-    print("---")
-    print(f"All files: {len(filenames)}")
-    print(f"No changes: {len(files_no_changes)}")
-    print(f"Files updated: {len(files_updated) - len(files_no_automatic_update)}")
-    print(f"Files (no automatic update): {len(files_no_automatic_update)}")
-
-    if (
-        not files_no_automatic_update
-        and not args.force
-        and not args.only_force
-        and args.verbose == 0
-    ):
-        return 0
-    if files_no_automatic_update:
-        return 2
-    if args.verbose > 0:
-        return 12
-    return 0
+    files_no_automatic_update = summary.files_no_automatic_update
+    if files_no_automatic_update and args.diff is False and not (args.force or args.only_force):
+        with profile.measure_phase("restore"):
+            await async_restore_files(snapshot, files_no_automatic_update)
+    return summary
@@ -0,0 +1,112 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+import json
+import time
+from typing import Any
+
+SLOWEST_FILES = 10
+
+
+def percentile(values: list[float], percent: int) -> float:
+    """Return percentile of sorted values (nearest rank)."""
+    if not values:
+        return 0.0
+    index = max(0, -(-len(values) * percent // 100) - 1)
+    return values[index]
+
+
+class StageProfile:
+    """Collect wall time per stage and file.
+
+    If disabled, nothing is recorded. With per_file, the wall time of
+    each stage is also kept per file until it's taken with 'pop_file'.
+    """
+
+    def __init__(self, enabled: bool, per_file: bool = False) -> None:
+        self.enabled = enabled
+        self.per_file = per_file
+        self.phases: dict[str, float] = {}
+        self.stages: defaultdict[str, list[float]] = defaultdict(list)
+        self.files: defaultdict[str, float] = defaultdict(float)
+        self.file_stages: defaultdict[str, dict[str, float]] = defaultdict(dict)
+
+    def add(self, stage: str, duration: float, filename: str | None = None) -> None:
+        if self.per_file is True and filename is not None:
+            file_stages = self.file_stages[filename]
+            file_stages[stage] = file_stages.get(stage, 0.0) + duration
+        if self.enabled is False:
+            return
+        self.stages[stage].append(duration)
+        if filename is not None:
+            self.files[filename] += duration
+
+    def add_all(self, timings: Mapping[str, float], filename: str | None = None) -> None:
+        for stage, duration in timings.items():
+            self.add(stage, duration, filename)
+
+    def pop_file(self, filename: str) -> dict[str, float]:
+        """Return and drop the wall time per stage of a file."""
+        return self.file_stages.pop(filename, {})
+
+    @contextmanager
+    def measure(self, stage: str, filename: str | None = None) -> Iterator[None]:
+        """Measure stage, optionally for a single file."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, filename)
+
+    @contextmanager
+    def measure_phase(self, phase: str) -> Iterator[None]:
+        """Measure run phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled is True:
+                self.phases[phase] = self.phases.get(phase, 0.0) + time.perf_counter() - start
+
+    def to_dict(self) -> dict[str, Any]:
+        stages: dict[str, dict[str, float]] = {}
+        for stage, durations in self.stages.items():
+            values = sorted(durations)
+            stages[stage] = {
+                "count": len(values),
+                "total": sum(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "max": values[-1],
+            }
+        slowest = sorted(self.files.items(), key=lambda item: item[1], reverse=True)[:SLOWEST_FILES]
+        return {
+            "phases": self.phases,
+            "stages": stages,
+            "slowest_files": [{"filename": file_, "total": total} for file_, total in slowest],
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+
+    def print_report(self) -> None:
+        data = self.to_dict()
+        print("--- Profile")
+        print("Phases:")
+        for phase, total in data["phases"].items():
+            print(f" - {phase}: {total:.3f}s")
+        print(f"{'Stage':<24} {'Count':>7} {'Total':>9} {'p50':>9} {'p95':>9} {'Max':>9}")
+        for stage, values in data["stages"].items():
+            print(
+                f"{stage:<24} {values['count']:>7} {values['total']:>8.3f}s "
+                f"{values['p50']:>8.4f}s {values['p95']:>8.4f}s {values['max']:>8.4f}s"
+            )
+        print("Slowest files:")
+        for item in data["slowest_files"]:
+            print(f" - {item['filename']}: {item['total']:.3f}s")
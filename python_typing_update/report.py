@@ -0,0 +1,81 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""Machine-readable report of a run, written as JSON Lines.
+
+Each file gets a line as soon as it's done:
+    {"file": ..., "status": ..., "flags": [...], "imports_removed": [...], "timings": {...}}
+If the status of an updated file changes at the end of the run, e.g. after
+'ruff' removed an import or with '--limit', the complete line is written
+again. The last line for a file wins. The run totals are written last:
+    {"totals": {...}}
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+import json
+from typing import Any, TextIO
+
+from .const import FileStatus
+
+# Final status of a file
+STATUS_UPDATED = "updated"
+STATUS_NO_CHANGES = "no_changes"
+STATUS_PREFILTERED = "prefiltered"
+STATUS_SKIPPED = "skipped"  # '--only-force'
+STATUS_COMMENT = "comment"
+STATUS_IMPORTS_CHANGED = "imports_changed"
+STATUS_RESTORED = "restored"  # '--limit'
+
+
+def status_flags(status: FileStatus) -> list[str]:
+    return [str(member.name) for member in FileStatus if member.value and member in status]
+
+
+class RunReport:
+    """Write the report line by line to path.
+
+    Only the lines of updated files are kept, so their status can be
+    changed at the end of the run.
+    """
+
+    def __init__(self, path: str) -> None:
+        # Line buffered, an interrupted run still leaves all finished lines
+        self._fp: TextIO = open(path, "w", encoding="utf-8", buffering=1)  # pylint: disable=consider-using-with
+        self._updated: dict[str, dict[str, Any]] = {}
+
+    def _write(self, data: Mapping[str, Any]) -> None:
+        self._fp.write(json.dumps(data) + "\n")
+
+    def add_file(
+        self,
+        filename: str,
+        status: str,
+        flags: FileStatus = FileStatus.CLEAR,
+        imports_removed: Iterable[str] = (),
+        timings: Mapping[str, float] | None = None,
+    ) -> None:
+        data = {
+            "file": filename,
+            "status": status,
+            "flags": status_flags(flags),
+            "imports_removed": sorted(imports_removed),
+            "timings": dict(timings or {}),
+        }
+        if status not in (STATUS_NO_CHANGES, STATUS_PREFILTERED, STATUS_SKIPPED):
+            self._updated[filename] = data
+        self._write(data)
+
+    def update_file(self, filename: str, status: str, imports_removed: Iterable[str]) -> None:
+        """Write line again, if the status of an updated file changed."""
+        data = self._updated[filename]
+        imports_removed = sorted(imports_removed)
+        if data["status"] != status or data["imports_removed"] != imports_removed:
+            data.update(status=status, imports_removed=imports_removed)
+            self._write(data)
+
+    def close(self, totals: Mapping[str, Any] | None = None) -> None:
+        """Write totals, if the run wasn't interrupted, and close the report."""
+        if totals is not None:
+            self._write({"totals": totals})
+        self._fp.close()
@@ -0,0 +1,338 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from enum import Enum
+from functools import lru_cache
+import io
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import Any, TextIO
+
+import autoflake
+from isort.api import sort_code_string
+from isort.exceptions import FileSkipped, ISortError
+from isort.settings import Config
+from pyupgrade._data import Settings as PyupgradeSettings
+from pyupgrade._main import _fix_plugins, _fix_tokens
+from reorder_python_imports import (
+    REMOVALS, REPLACES, Replacements, Settings as ReorderSettings,
+    _validate_replace_import, fix_file_contents, import_obj_from_str)
+
+from .const import FileStatus, UpdateResult
+
+# Config files read by autoflake or isort, searched from the file directory upwards
+CONFIG_FILES = (".editorconfig", ".isort.cfg", "pyproject.toml", "setup.cfg", "tox.ini")
+# Properties of the isort config which are computed on first access
+ISORT_LAZY_PROPERTIES = (
+    "known_patterns", "section_comments", "section_comments_end",
+    "skips", "skip_globs", "sorting_function",
+)
+# Directories with a loaded config
+_config_directories: set[str] = set()
+
+
+class _CaptureLocal(threading.local):
+    buffer: io.StringIO | None = None
+
+
+class _ThreadCapture:
+    """Stream proxy which captures writes from threads with an active capture.
+
+    Writes from all other threads are passed through to the wrapped stream.
+    """
+
+    def __init__(self, stream: TextIO, local: _CaptureLocal) -> None:
+        self._stream = stream
+        self._local = local
+
+    def write(self, data: str) -> int:
+        if (buffer := self._local.buffer) is not None:
+            return buffer.write(data)
+        return self._stream.write(data)
+
+    def flush(self) -> None:
+        if self._local.buffer is None:
+            self._stream.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class _StreamProxies:
+    """Replace sys.stdout and sys.stderr only while a capture is active."""
+
+    def __init__(self, local: _CaptureLocal) -> None:
+        self._local = local
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def install(self) -> None:
+        with self._lock:
+            if self._active == 0:
+                sys.stdout = _ThreadCapture(sys.stdout, self._local)
+                sys.stderr = _ThreadCapture(sys.stderr, self._local)
+            self._active += 1
+
+    def uninstall(self) -> None:
+        with self._lock:
+            self._active -= 1
+            if self._active > 0:
+                return
+            # Unless replaced in the meantime
+            if isinstance(sys.stdout, _ThreadCapture):
+                sys.stdout = sys.stdout._stream  # pylint: disable=protected-access
+            if isinstance(sys.stderr, _ThreadCapture):
+                sys.stderr = sys.stderr._stream  # pylint: disable=protected-access
+
+
+_capture_local = _CaptureLocal()
+_stream_proxies = _StreamProxies(_capture_local)
+
+
+@contextmanager
+def capture_output() -> Iterator[io.StringIO]:
+    """Capture stdout and stderr of the current thread.
+
+    Unlike 'contextlib.redirect_stdout', output of other threads
+    isn't affected. That includes concurrent runs in the same process.
+    The streams are restored once the last capture is done.
+    Captures can be nested.
+    """
+    _stream_proxies.install()
+    buffer_outer = _capture_local.buffer
+    buffer = _capture_local.buffer = io.StringIO()
+    try:
+        yield buffer
+    finally:
+        _capture_local.buffer = buffer_outer
+        _stream_proxies.uninstall()
+
+
+@lru_cache
+def _reorder_options(
+    min_version: tuple[int, ...],
+) -> tuple[set[tuple[object, ...]], Replacements]:
+    """Resolve imports to remove / replace for 'reorder-python-imports'."""
+    to_remove = {
+        import_obj_from_str(s).key_with_lazy
+        for k, v in REMOVALS.items()
+        if min_version >= k
+        for s in v
+    }
+    to_replace = Replacements.make([
+        _validate_replace_import(s)
+        for k, v in REPLACES.items()
+        if min_version >= k
+        for s in v
+    ])
+    return to_remove, to_replace
+
+
+def run_reorder_python_imports(content: str, min_version: tuple[int, ...]) -> str:
+    """Add, replace and reorder imports (reorder-python-imports)."""
+    to_remove, to_replace = _reorder_options(min_version)
+    new_content: str = fix_file_contents(
+        content,
+        to_remove=to_remove,
+        to_replace=to_replace,
+        settings=ReorderSettings(),
+    )
+    return new_content
+
+
+def run_pyupgrade(content: str, min_version: tuple[int, ...]) -> str:
+    """Upgrade syntax for newer Python versions (pyupgrade)."""
+    content = _fix_plugins(
+        content,
+        settings=PyupgradeSettings(min_version=min_version),
+    )
+    new_content: str = _fix_tokens(content)
+    return new_content
+
+
+@lru_cache
+def _autoflake_config(directory: str) -> dict[str, Any] | None:
+    """Load autoflake config for all files in directory.
+
+    Return None if the config file couldn't be parsed.
+    """
+    _config_directories.add(directory)
+    args, success = autoflake.merge_configuration_file({"files": [directory]})
+    if not success:
+        return None
+    return dict(args)
+
+
+def run_autoflake(filename: str, content: str) -> str:
+    """Remove unused imports (autoflake)."""
+    args = _autoflake_config(os.path.dirname(os.path.abspath(filename)))
+    if args is None:
+        return content
+    new_content: str = autoflake.fix_code(
+        content,
+        additional_imports=(args["imports"].split(",") if "imports" in args else None),
+        expand_star_imports=args["expand_star_imports"],
+        remove_all_unused_imports=args["remove_all_unused_imports"],
+        remove_duplicate_keys=args["remove_duplicate_keys"],
+        remove_unused_variables=args["remove_unused_variables"],
+        remove_rhs_for_unused_variables=args["remove_rhs_for_unused_variables"],
+        ignore_init_module_imports=(
+            args["ignore_init_module_imports"]
+            and os.path.basename(filename) == "__init__.py"
+        ),
+        ignore_pass_statements=args["ignore_pass_statements"],
+        ignore_pass_after_docstring=args["ignore_pass_after_docstring"],
+    )
+    return new_content
+
+
+@lru_cache
+def _isort_config(directory: str) -> Config:
+    """Load isort config for all files in directory.
+
+    With '--jobs 1' the config is shared by the threads which update files.
+    Compute the properties isort caches lazily upfront, as that isn't thread-safe.
+    """
+    _config_directories.add(directory)
+    config = Config(settings_path=directory)
+    for name in ISORT_LAZY_PROPERTIES:
+        getattr(config, name)
+    return config
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, (set, frozenset)):
+        return sorted(map(str, obj))
+    if isinstance(obj, Enum):
+        return obj.name
+    return str(obj)
+
+
+@lru_cache
+def config_fingerprint(directory: str) -> str:
+    """Return fingerprint of the autoflake and isort configs for files in directory."""
+    return json.dumps(
+        [_autoflake_config(directory), _isort_config(directory).sources],
+        sort_keys=True, default=_json_default,
+    )
+
+
+def config_stamp() -> dict[str, tuple[int, int] | None]:
+    """Return mtime and size of all config files which apply to the loaded configs."""
+    stamp: dict[str, tuple[int, int] | None] = {}
+    seen: set[str] = set()
+    for directory in list(_config_directories):
+        while directory not in seen:
+            seen.add(directory)
+            for name in CONFIG_FILES:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                    stamp[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    stamp[path] = None
+            directory = os.path.dirname(directory)
+    return stamp
+
+
+def clear_config_caches() -> None:
+    """Discard all loaded configs."""
+    _autoflake_config.cache_clear()
+    _isort_config.cache_clear()
+    config_fingerprint.cache_clear()
+    _config_directories.clear()
+
+
+def run_isort(filename: str, content: str) -> str:
+    """Sort imports (isort)."""
+    config = _isort_config(os.path.dirname(os.path.abspath(filename)))
+    if config.filter_files and config.is_skipped(Path(filename)):
+        return content
+    try:
+        return sort_code_string(
+            content, config=config, file_path=Path(filename), disregard_skip=True,
+        )
+    except (FileSkipped, ISortError):
+        return content
+
+
+def init_worker(min_version: tuple[int, ...]) -> None:
+    """Initialize worker process.
+
+    Importing this module loads all tools, additionally
+    resolve the options for reorder-python-imports upfront.
+    """
+    _reorder_options((0,))
+    _reorder_options(min_version)
+
+
+def update_content(
+    filename: str,
+    content: str,
+    args: argparse.Namespace,
+    file_status: FileStatus,
+) -> UpdateResult:
+    """Run all in-memory update stages.
+
+    Output of the tools is captured per file.
+
+    Returns status:
+        - 0: content was updated
+        - 2: if not typing update is necessary
+    """
+    with capture_output() as output:
+        status, content, timings = _update_content(filename, content, args, file_status)
+    return UpdateResult(status, content, timings, output.getvalue())
+
+
+def _update_content(
+    filename: str,
+    content: str,
+    args: argparse.Namespace,
+    file_status: FileStatus,
+) -> tuple[int, str, dict[str, float]]:
+    timings: dict[str, float] = {}
+
+    def timed(stage: str, func: Callable[..., str], *func_args: Any) -> str:
+        start = time.perf_counter()
+        try:
+            return func(*func_args)
+        finally:
+            timings[stage] = time.perf_counter() - start
+
+    # Add, replace and reorder imports
+    content = timed(
+        "reorder-python-imports", run_reorder_python_imports,
+        content, args.min_version if args.full_reorder else (0,),
+    )
+
+    # Run pyupgrade
+    content_pyupgrade = timed("pyupgrade", run_pyupgrade, content, args.min_version)
+    if content_pyupgrade == content and not args.full_reorder:
+        # -> No updates made
+        return 2, content, timings
+    content = content_pyupgrade
+
+    # Check for and remove unused imports (autoflake)
+    content_autoflake = timed("autoflake", run_autoflake, filename, content)
+    if (
+        content_autoflake == content
+        and args.keep_updates is False
+        and args.full_reorder is False
+        and FileStatus.COMMENT_TYPING not in file_status
+    ):
+        # -> No unused imports
+        return 2, content, timings
+    content = content_autoflake
+
+    # Run isort
+    return 0, timed("isort", run_isort, filename, content), timings
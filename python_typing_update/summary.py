@@ -0,0 +1,208 @@
+# ---------------------------------------------------------------------------
+# Licensed under the MIT License. See LICENSE file for license information.
+# ---------------------------------------------------------------------------
+"""Summary of a run, can be written as JSON and merged across shards.
+
+Usage: python -m python_typing_update.summary REPORT [REPORT ...]
+
+Prints the combined summary of the reports, written with '--summary-json',
+and exits with the return code a single run over all files would have.
+"""
+from __future__ import annotations
+
+import argparse
+from collections.abc import Iterable
+import json
+import sys
+from typing import Any, NamedTuple
+
+SUMMARY_VERSION = 1
+
+
+class SummaryOptions(NamedTuple):
+    """Options which change the summary and the return code."""
+
+    check: bool
+    diff: bool
+    force: bool
+    verbose: int
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> SummaryOptions:
+        return cls(args.check, args.diff, args.force or args.only_force, args.verbose)
+
+
+class RunSummary(NamedTuple):
+    """Result of a run, all file lists are sorted."""
+
+    num_files: int
+    num_no_changes: int
+    num_prefiltered: int
+    files_updated: list[str]
+    files_with_comments: list[str]
+    files_imports_changed: list[str]
+
+    @property
+    def files_no_automatic_update(self) -> set[str]:
+        return set(self.files_with_comments + self.files_imports_changed)
+
+    @classmethod
+    def merge(cls, summaries: Iterable[RunSummary]) -> RunSummary:
+        num_files = num_no_changes = num_prefiltered = 0
+        files_updated: list[str] = []
+        files_with_comments: list[str] = []
+        files_imports_changed: list[str] = []
+        for summary in summaries:
+            num_files += summary.num_files
+            num_no_changes += summary.num_no_changes
+            num_prefiltered += summary.num_prefiltered
+            files_updated.extend(summary.files_updated)
+            files_with_comments.extend(summary.files_with_comments)
+            files_imports_changed.extend(summary.files_imports_changed)
+        return cls(
+            num_files, num_no_changes, num_prefiltered,
+            sorted(files_updated), sorted(files_with_comments), sorted(files_imports_changed),
+        )
+
+
+def print_summary(summary: RunSummary, options: SummaryOptions) -> int:
+    """Print summary of a run.
+
+    Returns:
+        0: Files updated or check passed
+        1: Check did not pass, files would be updated
+        2: Couldn't update all files
+        12: Debug mode
+    """
+    files_no_automatic_update = summary.files_no_automatic_update
+
+    if options.diff is True:
+        if files_no_automatic_update:
+            print("Could not update all files, check:", file=sys.stderr)
+            for file_ in sorted(files_no_automatic_update):
+                print(f" - {file_}", file=sys.stderr)
+        return 1 if len(summary.files_updated) > len(files_no_automatic_update) else 0
+
+    if options.check is True:
+        if summary.files_updated:
+            print("The following files need to be updated:")
+            for file_ in summary.files_updated:
+                print(f" - {file_}")
+            return 1
+        return 0
+
+    if files_no_automatic_update:
+        if options.force:
+            print("Force mode selected!")
+            print("Make sure to double check:")
+        else:
+            print("Could not update all files, check:")
+        for file_ in summary.files_with_comments:
+            print(f" - {file_}")
+        if summary.files_with_comments and summary.files_imports_changed:
+            print(" --")
+        for file_ in summary.files_imports_changed:
+            print(f" - {file_}")
+
+    print("---")
+    print(f"All files: {summary.num_files}")
+    print(f"No changes: {summary.num_no_changes}")
+    print(f"Skipped by pre-filter: {summary.num_prefiltered}")
+    print(f"Files updated: {len(summary.files_updated) - len(files_no_automatic_update)}")
+    print(f"Files (no automatic update): {len(files_no_automatic_update)}")
+
+    if files_no_automatic_update:
+        return 2
+    if options.verbose > 0:
+        return 12
+    return 0
+
+
+def write_summary_json(
+    path: str,
+    options: SummaryOptions,
+    returncode: int,
+    summary: RunSummary | None,
+    shard: tuple[int, int] | None = None,
+) -> None:
+    """Write summary as JSON to path.
+
+    The summary is None if the run was aborted.
+    """
+    data: dict[str, Any] = {
+        "version": SUMMARY_VERSION,
+        "shard": shard,
+        "options": options._asdict(),
+        "returncode": returncode,
+        "summary": summary._asdict() if summary is not None else None,
+    }
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(data, fp, indent=2)
+        fp.write("\n")
+
+
+def merge_summaries(paths: list[str]) -> int:
+    """Print combined summary of the JSON reports.
+
+    Returns:
+        0 / 1 / 2 / 12: like a single run, see 'print_summary'
+        10: Report missing, invalid or from a different run
+        11 / 13: A run was aborted with this return code
+    """
+    reports: list[tuple[str, SummaryOptions, tuple[int, int] | None, int, RunSummary | None]] = []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as fp:
+                data = json.load(fp)
+            if data["version"] != SUMMARY_VERSION:
+                raise ValueError
+            reports.append((
+                path,
+                SummaryOptions(**data["options"]),
+                (int(data["shard"][0]), int(data["shard"][1])) if data["shard"] is not None else None,
+                int(data["returncode"]),
+                RunSummary(**data["summary"]) if data["summary"] is not None else None,
+            ))
+        except (OSError, ValueError, KeyError, TypeError):
+            print(f"Abort! Unable to read report '{path}'.")
+            return 10
+
+    options = {report[1] for report in reports}
+    if len(options) > 1:
+        print("Abort! Reports were created with different options.")
+        return 10
+    shards = {report[2] for report in reports if report[2] is not None}
+    if shards:
+        if len(shards) != len(reports):
+            print("Abort! Each report has to be for a different shard.")
+            return 10
+        num_shards = {count for _, count in shards}
+        if len(num_shards) > 1:
+            print("Abort! Reports were created with a different number of shards.")
+            return 10
+        count = num_shards.pop()
+        if missing := [f"{index}/{count}" for index in range(1, count + 1) if (index, count) not in shards]:
+            print(f"Abort! Missing reports for shards: {', '.join(missing)}")
+            return 10
+
+    summaries: list[RunSummary] = []
+    for path, _, _, returncode, summary in reports:
+        if summary is None:
+            print(f"Abort! The run for '{path}' failed with {returncode}.")
+            return returncode
+        summaries.append(summary)
+    return print_summary(RunSummary.merge(summaries), options.pop())
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m python_typing_update.summary",
+        description="Merge the '--summary-json' reports of multiple runs.",
+    )
+    parser.add_argument('reports', nargs='+', metavar="REPORT")
+    args = parser.parse_args(argv)
+    return merge_summaries(args.reports)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,49 +4,281 @@
 from __future__ import annotations
 
 import asyncio
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Iterator, Mapping
+import contextlib
+import difflib
+import fnmatch
+import io
+import mmap
 import os
 from pathlib import Path
+import re
 import token
 import tokenize
 from typing import TextIO
+import zlib
 
 from .const import FileStatus
+from .discovery import is_glob
+
+# Stay below the Windows limit (32767) for the full command line
+MAX_CMD_LENGTH = 30_000
+# Matches the raw bytes, any non-ASCII byte is treated as part of a name
+RE_STRING_ANNOTATION = re.compile(
+    rb"""^\s*[\w.\x80-\xff]+\s*:[^=\n]*['"]"""  # variable annotation
+    rb"""|[(,]\s*\*{0,2}[\w\x80-\xff]+\s*:[^,)=\n]*['"]"""  # argument annotation
+    rb"""|->[^:\n]*['"]""",  # return annotation
+    re.MULTILINE,
+)
 
 
 def check_files_exist(file_list: Iterable[str]) -> list[str]:
-    """Check if all files exist. Return False if not."""
+    """Check if all files and directories exist. Return the missing ones.
+
+    Glob patterns are skipped.
+    """
     file_errors: list[str] = []
     cwd = Path(os.getcwd())
     for file_ in file_list:
-        if cwd.joinpath(file_).is_file() is False:
+        path = cwd.joinpath(file_)
+        if path.is_file() is False and path.is_dir() is False and is_glob(file_) is False:
             file_errors.append(file_)
     return sorted(file_errors)
 
 
-async def async_restore_files(file_list: Iterable[str]) -> None:
+def restore_files(snapshot: Mapping[str, str], file_list: Iterable[str]) -> None:
+    """Write original content from snapshot back to disk.
+
+    Files not in the snapshot were never modified and are skipped.
+    """
+    for file_ in file_list:
+        if (content := snapshot.get(file_)) is None:
+            continue
+        with open(file_, "w", encoding="utf-8", newline="") as fp:
+            fp.write(content)
+
+
+async def async_restore_files(snapshot: Mapping[str, str], file_list: Iterable[str]) -> None:
     if not file_list:
         return
-    process = await asyncio.create_subprocess_shell(
-        f"git restore -- {' '.join(file_list)}",
-    )
-    await process.communicate()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, restore_files, snapshot, list(file_list))
+
+
+def analyze_file(filename: str, min_version: tuple[int, ...]) -> tuple[FileStatus, set[str], bool]:
+    """Analyze file without loading its full content.
+
+    The main import block is tokenized while the file is read
+    incrementally, reading stops once the block ends. The pre-filter
+    searches the raw bytes of the memory-mapped file.
+
+    Returns:
+        - FileStatus and imports of the main import block, see 'analyze_imports'
+        - if the file may need a typing update, see 'may_need_typing_update'
+    """
+    with open(filename, "rb") as fp:
+        try:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                may_need_update = may_need_typing_update(data, min_version)
+        except (ValueError, OSError):
+            # -> Empty file or not mappable
+            may_need_update = may_need_typing_update(fp.read(), min_version)
+        fp.seek(0)
+        with io.TextIOWrapper(fp, encoding="utf-8") as text_fp:
+            file_status, imports = analyze_imports(text_fp)
+    return file_status, imports, may_need_update
+
+
+def may_need_typing_update(content: str | bytes | mmap.mmap, min_version: tuple[int, ...]) -> bool:
+    """Check if pyupgrade could rewrite any typing syntax.
+
+    Only return False if the content doesn't reference 'typing' /
+    'typing_extensions' and has no other construct pyupgrade rewrites
+    for typing, like quoted annotations. Other pyupgrade rewrites,
+    e.g. 'io.open', aren't considered. Thus it can't be used if
+    those files would be written or reported.
+    The content can be the raw bytes, e.g. a memory-mapped file,
+    it's never decoded.
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    if content.find(b"typing") != -1:
+        return True
+    if min_version >= (3, 13) and content.find(b"collections.abc") != -1:
+        # Default type arguments for Generator and AsyncGenerator
+        return True
+    if (
+        (min_version >= (3, 14) or content.find(b"annotations") != -1)
+        and RE_STRING_ANNOTATION.search(content) is not None
+    ):
+        # Quoted annotations
+        return True
+    return False
+
+
+def chunk_file_list(file_list: Iterable[str], max_length: int = MAX_CMD_LENGTH) -> Iterator[list[str]]:
+    """Split file list into chunks to stay below the max command line length."""
+    chunk: list[str] = []
+    chunk_length: int = 0
+    for file_ in file_list:
+        if chunk and chunk_length + len(file_) + 1 > max_length:
+            yield chunk
+            chunk, chunk_length = [], 0
+        chunk.append(file_)
+        chunk_length += len(file_) + 1
+    if chunk:
+        yield chunk
+
+
+async def async_run_formatter(cmd: list[str], file_list: Iterable[str]) -> None:
+    """Run formatter once for all files (per chunk)."""
+    for chunk in chunk_file_list(file_list):
+        process = await asyncio.create_subprocess_exec(
+            *cmd, *chunk,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        await process.communicate()
+
+
+def _uncommitted_pathspec(item: str) -> str:
+    """Convert input to git pathspec."""
+    if os.path.isdir(item):
+        return os.path.join(item, "*.py")
+    if is_glob(item) and not os.path.lexists(item):
+        return item
+    return f":(literal){item}"
+
+
+def _inputs_matcher(file_list: Iterable[str]) -> Callable[[str], bool]:
+    """Return check if a file from git is one of the files, directories or glob patterns.
+
+    The inputs are classified once. Files are looked up in a set,
+    directories are matched as path prefixes.
+    """
+    paths: set[str] = set()
+    prefixes: list[str] = []
+    patterns: list[str] = []
+    for item in file_list:
+        path = os.path.normpath(item)
+        paths.add(path.replace(os.sep, "/"))
+        if os.path.isdir(path):
+            prefixes.append("" if path == "." else path.replace(os.sep, "/") + "/")
+        elif is_glob(item):
+            patterns.append(path.replace(os.sep, "/"))
+    prefixes_tuple = tuple(prefixes)
+
+    def matches(file_: str) -> bool:
+        return (
+            file_ in paths
+            or (file_.endswith(".py") and file_.startswith(prefixes_tuple))
+            or any(fnmatch.fnmatch(file_, pattern) for pattern in patterns)
+        )
+
+    return matches
 
 
 async def async_check_uncommitted_changes(file_list: Iterable[str]) -> bool:
-    """Check for uncommitted changes.
+    """Check for uncommitted changes in files, directories and glob patterns.
+
+    The diff is limited to the inputs as pathspecs. If they don't fit in
+    a single command line, the whole repository is diffed instead.
+    The NUL-delimited output is parsed while git is still running
+    and git is stopped at the first match.
 
     Returns:
         False: if changes still need to be committed
     """
-    process = await asyncio.create_subprocess_shell(
-        "git diff-index --name-only HEAD --",
+    file_list = list(file_list)
+    pathspecs = [_uncommitted_pathspec(item) for item in file_list]
+    use_pathspecs = sum(len(pathspec) + 1 for pathspec in pathspecs) <= MAX_CMD_LENGTH
+    matches_inputs = _inputs_matcher(file_list) if not use_pathspecs else None
+    cmd = ["git", "diff-index", "--name-only", "-z", "HEAD", "--", *pathspecs] if use_pathspecs \
+        else ["git", "diff-index", "--name-only", "-z", "--relative", "HEAD", "--"]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    assert process.stdout is not None
+    remainder = b""
+    found = False
+    try:
+        while found is False and (chunk := await process.stdout.read(2 ** 16)):
+            *items, remainder = (remainder + chunk).split(b"\0")
+            found = any(
+                matches_inputs is None or matches_inputs(os.fsdecode(item))
+                for item in items
+            )
+    finally:
+        if process.stdout.at_eof() is False:
+            # -> Stopped early
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+        await process.wait()
+    return not found
+
+
+async def async_changed_files(ref: str) -> set[str] | None:
+    """Return '.py' files changed since the merge-base of ref and HEAD.
+
+    Uncommitted changes are included, deleted files are not. All files
+    of the repository are considered, also those outside the current
+    working directory. The paths are absolute and normalized, see 'abs_path'.
+
+    Returns:
+        None: if git failed, e.g. ref is unknown
+    """
+    process = await asyncio.create_subprocess_exec(
+        "git", "rev-parse", "--show-cdup",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    # Relative path from the current working directory to the repository root
+    root = stdout.decode().strip()
+
+    process = await asyncio.create_subprocess_exec(
+        "git", "diff", "--name-only", "-z", "--diff-filter=d",
+        "--merge-base", ref, "--", ":(top)*.py",
         stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
     )
     stdout, _ = await process.communicate()
-    files_uncommitted: set[str] = {file_ for item in stdout.decode().split('\n')
-                                   if (file_ := item.strip())}
-    return not any(True for file_ in file_list if file_ in files_uncommitted)
+    if process.returncode != 0:
+        return None
+    return {abs_path(os.path.join(root, file_)) for file_ in os.fsdecode(stdout).split('\0') if file_}
+
+
+def abs_path(filename: str) -> str:
+    """Return absolute, normalized path to compare files given in different ways."""
+    return os.path.normcase(os.path.abspath(filename))
+
+
+def in_shard(filename: str, index: int, count: int) -> bool:
+    """Check if file belongs to shard index (1-based) of count.
+
+    The partition only depends on the normalized path, so it's stable
+    across runs, machines and the order in which files are discovered.
+    """
+    key = os.path.normpath(filename).replace(os.sep, "/")
+    return zlib.crc32(key.encode()) % count == index - 1
+
+
+def unified_diff(filename: str, content_orig: str, content: str) -> str:
+    """Create unified diff in the format of 'git diff'."""
+    lines: list[str] = []
+    for line in difflib.unified_diff(
+        content_orig.splitlines(keepends=True),
+        content.splitlines(keepends=True),
+        fromfile=f"a/{filename}", tofile=f"b/{filename}",
+    ):
+        lines.append(line)
+        if not line.endswith("\n"):
+            lines.append("\n\\ No newline at end of file\n")
+    return "".join(lines)
 
 
 def check_comment_between_imports(fp: TextIO) -> FileStatus:
@@ -54,7 +286,23 @@ def check_comment_between_imports(fp: TextIO) -> FileStatus:
 
     Sign that the file can't be updated automatically.
     """
+    return analyze_imports(fp)[0]
+
+
+def extract_imports(fp: TextIO) -> set[str]:
+    """Create set of all imports in main import block."""
+    return analyze_imports(fp)[1]
+
+
+def analyze_imports(fp: TextIO) -> tuple[FileStatus, set[str]]:
+    """Analyze main import block in a single token scan.
+
+    Returns:
+        - FileStatus: if comments are found between imports
+        - set of all imports in main import block
+    """
     flag_in_import_block: bool = False
+    # Comment detection
     flag_multiple_imports: bool = False
     flag_typing_import: bool = False
     token_name_count: int = 0
@@ -62,84 +310,35 @@ def check_comment_between_imports(fp: TextIO) -> FileStatus:
     line_last_import: int = 0
     line_comments: list[tuple[int, int]] = []
     return_value: FileStatus = FileStatus.CLEAR
-
-    tokens = tokenize.generate_tokens(fp.readline)
-    while True:
-        try:
-            t = next(tokens)
-            if flag_in_import_block is True:
-                if t.type == token.NAME and token_name_count == 0:
-                    token_name_count += 1
-                    if t.string == 'typing':
-                        flag_typing_import = True
-                elif t.type == token.NEWLINE:
-                    flag_in_import_block = False
-                    flag_multiple_imports = False
-                    flag_typing_import = False
-                    token_name_count = 0
-                elif t.type == token.OP and t.string != '.':
-                    flag_multiple_imports = True
-                elif t.type == token.COMMENT:
-                    if flag_typing_import is True:
-                        return_value = return_value | FileStatus.COMMENT | FileStatus.COMMENT_TYPING
-                    elif flag_multiple_imports is True:
-                        # Comment in same line as import statement
-                        return_value = return_value | FileStatus.COMMENT
-                continue
-            if t.type == token.NAME:
-                if t.string in ('import', 'from'):
-                    flag_in_import_block = True
-                    if line_first_import is None:
-                        line_first_import = t.start[0]
-                    line_last_import = t.start[0]
-                else:
-                    # Any other code block,
-                    # not in main import block anymore
-                    break
-            elif t.type in (token.COMMENT, token.STRING):
-                line_comments.append((t.type, t.start[0]))
-        except StopIteration:
-            break
-
-    if return_value != FileStatus.CLEAR:
-        # If inline comment was detected, stop here
-        return return_value
-
-    for _, line_number in line_comments:
-        if line_first_import is None:
-            # No import block detected
-            return FileStatus.CLEAR
-        if (line_first_import < line_number < line_last_import):
-            # Report all comments in the main import block
-            return FileStatus.COMMENT
-    return FileStatus.CLEAR
-
-
-def extract_imports(fp: TextIO) -> set[str]:
-    """Create set of all imports in main import block."""
-    flag_in_import_block: bool = False
+    # Import extraction
     flag_relative_import: bool | None = None
     flag_imports: bool = False
     flag_last_token_name: bool = False
     current_package: str = ''
     imports: set[str] = set()
 
-    tokens = tokenize.generate_tokens(fp.readline)
-    while True:
-        try:
-            t = next(tokens)
-            if flag_in_import_block is True:
-                if t.type == token.NEWLINE:
-                    if flag_relative_import is False:
-                        imports.add(current_package)
-                    flag_in_import_block = False
-                    flag_relative_import = None
-                    flag_imports = False
-                    flag_last_token_name = False
-                    current_package = ''
-                elif t.type == token.NAME and t.string == 'import':
+    for t in tokenize.generate_tokens(fp.readline):
+        if flag_in_import_block is True:
+            if t.type == token.NEWLINE:
+                if flag_relative_import is False:
+                    imports.add(current_package)
+                flag_in_import_block = False
+                flag_multiple_imports = False
+                flag_typing_import = False
+                token_name_count = 0
+                flag_relative_import = None
+                flag_imports = False
+                flag_last_token_name = False
+                current_package = ''
+                continue
+            if t.type == token.NAME:
+                if token_name_count == 0:
+                    token_name_count += 1
+                    if t.string == 'typing':
+                        flag_typing_import = True
+                if t.string == 'import':
                     flag_imports = True
-                elif t.type == token.NAME and flag_last_token_name is False:
+                elif flag_last_token_name is False:
                     if (
                         flag_relative_import is False
                         or flag_relative_import is True
@@ -148,23 +347,46 @@ def extract_imports(fp: TextIO) -> set[str]:
                         current_package += t.string
                     elif flag_relative_import is True and flag_imports is True:
                         imports.add(f"{current_package}.{t.string}")
-                elif t.type == token.OP and t.string == '.':
+            elif t.type == token.OP:
+                if t.string == '.':
                     current_package += '.'
-                elif t.type == token.OP and t.string == ',' and flag_relative_import is False:
-                    imports.add(current_package)
-                    current_package = ''
-
-                flag_last_token_name = (t.type == token.NAME and t.string != 'import')
-                continue
-            if t.type == token.NAME:
-                if t.string == 'import':
-                    flag_in_import_block = True
-                    flag_relative_import = False
-                elif t.string == 'from':
-                    flag_in_import_block = True
-                    flag_relative_import = True
                 else:
-                    break
-        except StopIteration:
+                    flag_multiple_imports = True
+                    if t.string == ',' and flag_relative_import is False:
+                        imports.add(current_package)
+                        current_package = ''
+            elif t.type == token.COMMENT:
+                if flag_typing_import is True:
+                    return_value = return_value | FileStatus.COMMENT | FileStatus.COMMENT_TYPING
+                elif flag_multiple_imports is True:
+                    # Comment in same line as import statement
+                    return_value = return_value | FileStatus.COMMENT
+
+            flag_last_token_name = (t.type == token.NAME and t.string != 'import')
+            continue
+        if t.type == token.NAME:
+            if t.string in ('import', 'from'):
+                flag_in_import_block = True
+                flag_relative_import = t.string == 'from'
+                if line_first_import is None:
+                    line_first_import = t.start[0]
+                line_last_import = t.start[0]
+            else:
+                # Any other code block,
+                # not in main import block anymore
+                break
+        elif t.type in (token.COMMENT, token.STRING):
+            line_comments.append((t.type, t.start[0]))
+
+    if return_value != FileStatus.CLEAR:
+        # If inline comment was detected, stop here
+        return return_value, imports
+
+    for _, line_number in line_comments:
+        if line_first_import is None:
+            # No import block detected
             break
-    return imports
+        if (line_first_import < line_number < line_last_import):
+            # Report all comments in the main import block
+            return FileStatus.COMMENT, imports
+    return FileStatus.CLEAR, imports
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from pathlib import Path
+import subprocess
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Don't share the default result cache between test runs."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def git_repo(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Create git repo and use it as working directory.
+
+    The 'base' commit contains 'unchanged.py', 'modified.py' and 'deleted.py'.
+    The next commit adds 'added.py' and 'notes.txt', modifies 'modified.py'
+    and deletes 'deleted.py'. All '.py' files are copies of 'changed.py'.
+    """
+    content = Path(__file__).parent.joinpath("fixtures", "changed.py").read_text(encoding="utf-8")
+    repo = tmp_path / "repo"
+    repo.mkdir()
+
+    def git(*args: str) -> None:
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+            cwd=repo, capture_output=True, check=True,
+        )
+
+    git("init", "-q")
+    for name in ("unchanged.py", "modified.py", "deleted.py"):
+        (repo / name).write_text(content, encoding="utf-8")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+    git("tag", "base")
+
+    (repo / "added.py").write_text(content, encoding="utf-8")
+    (repo / "notes.txt").write_text("notes\n", encoding="utf-8")
+    (repo / "modified.py").write_text(content + "var8: List[int]\n", encoding="utf-8")
+    (repo / "deleted.py").unlink()
+    git("add", ".")
+    git("commit", "-q", "-m", "update")
+
+    monkeypatch.chdir(repo)
+    return repo
@@ -0,0 +1,7 @@
+"""Only a manual update, pyupgrade rewrites 'io.open'."""
+import io
+
+
+def func() -> str:
+    with io.open("file") as fp:
+        return fp.read()
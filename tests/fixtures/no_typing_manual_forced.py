@@ -0,0 +1,6 @@
+"""Only a manual update, pyupgrade rewrites 'io.open'."""
+
+
+def func() -> str:
+    with open("file") as fp:
+        return fp.read()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sqlite3
+
+import pytest
+
+from python_typing_update import cache as cache_module
+from python_typing_update.cache import CACHE_FILENAME, ResultCache
+
+
+def make_args(**kwargs: object) -> argparse.Namespace:
+    return argparse.Namespace(**{
+        "min_version": (3, 10), "full_reorder": False, "keep_updates": False, **kwargs,
+    })
+
+
+def test_cache_get_set(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path, max_size=1024 * 1024)
+    cache.set("key1", 0, "content")
+    cache.set("key2", 2, None)
+    assert cache.get("key1") == (0, "content")
+    assert cache.get("key2") == (2, None)
+    assert cache.get("key3") is None
+    assert cache.hits == 2
+    cache.close()
+
+    cache = ResultCache(tmp_path, max_size=1024 * 1024)
+    assert cache.get("key1") == (0, "content")
+    cache.close()
+
+
+def test_cache_key() -> None:
+    args = make_args()
+    key = ResultCache.make_key("file.py", "content", args)
+    assert key == ResultCache.make_key("file.py", "content", make_args())
+    assert key != ResultCache.make_key("file.py", "content 2", args)
+    assert key != ResultCache.make_key("file2.py", "content", args)
+    assert key != ResultCache.make_key("file.py", "content", make_args(min_version=(3, 11)))
+    assert key != ResultCache.make_key("file.py", "content", make_args(full_reorder=True))
+    assert key != ResultCache.make_key("file.py", "content", make_args(keep_updates=True))
+
+
+def test_cache_lru_eviction(tmp_path: Path) -> None:
+    cache = ResultCache(tmp_path, max_size=3 * (256 + 100))
+    for key in ("key1", "key2", "key3"):
+        cache.set(key, 0, "x" * 100)
+    assert cache.get("key1") is not None
+    cache.set("key4", 0, "x" * 100)
+    cache.close()
+
+    cache = ResultCache(tmp_path, max_size=3 * (256 + 100))
+    assert cache.get("key1") is not None
+    assert cache.get("key2") is None
+    assert cache.get("key3") is not None
+    assert cache.get("key4") is not None
+    cache.close()
+
+
+def test_cache_locked(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cache_module, "TIMEOUT", 0.1)
+    cache = ResultCache(tmp_path, max_size=1024 * 1024)
+    cache.set("key1", 0, "content")
+    other = sqlite3.connect(tmp_path / CACHE_FILENAME, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    # Reads don't block, writes are skipped while another run holds the lock
+    assert cache.get("key1") == (0, "content")
+    cache.set("key2", 0, "content")
+    cache.close()
+    other.execute("ROLLBACK")
+    other.close()
+
+    cache = ResultCache(tmp_path, max_size=1024 * 1024)
+    assert cache.get("key1") == (0, "content")
+    assert cache.get("key2") is None
+    cache.close()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+import os
+from pathlib import Path
+import sys
+
+import pytest
+
+from python_typing_update import stages
+from python_typing_update.__main__ import async_main
+from python_typing_update.daemon import (
+    async_serve, daemon_supported, forward)
+
+pytestmark = pytest.mark.skipif(not daemon_supported(), reason="Requires Unix sockets")
+
+
+@asynccontextmanager
+async def run_daemon(path: str, requests: list[list[str]]) -> AsyncGenerator[None]:
+    async def run(argv: list[str]) -> int:
+        requests.append(argv)
+        return await async_main(argv)
+
+    task = asyncio.ensure_future(async_serve(path, run))
+    while not os.path.exists(path):
+        assert task.done() is False
+        await asyncio.sleep(0.01)
+    try:
+        yield
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert not os.path.exists(path)
+
+
+async def run_client(*argv: str, env: dict[str, str] | None = None) -> tuple[int, str, str]:
+    """Run client in a separate process, like the pre-commit hook."""
+    env = {**os.environ, **(env or {}), "PYTHONPATH": str(Path(__file__).parents[1])}
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "python_typing_update", *argv,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env,
+    )
+    stdout, stderr = await process.communicate()
+    assert process.returncode is not None
+    return process.returncode, stdout.decode(), stderr.decode()
+
+
+def test_forward_no_daemon(tmp_path: Path) -> None:
+    assert forward(["changed.py"], str(tmp_path / "missing.sock")) is None
+
+
+async def test_daemon(git_repo: Path, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    path = str(tmp_path / "daemon.sock")
+    content_fixed = Path(__file__).parent.joinpath("fixtures", "changed_fixed.py").read_text(encoding="utf-8")
+    requests: list[list[str]] = []
+    async with run_daemon(path, requests):
+        assert await async_serve(path, async_main) == 14
+        assert "Daemon already running" in capsys.readouterr().out
+
+        returncode, out, _ = await run_client('--daemon-socket', path, '--jobs', '1', 'added.py')
+        assert returncode == 0
+        assert "All files: 1\n" in out
+        assert (git_repo / "added.py").read_text(encoding="utf-8") == content_fixed
+
+        assert os.stat(path).st_mode & 0o777 == 0o600
+
+        # Logging is forwarded
+        (tmp_path / "cache_file").write_text("", encoding="utf-8")
+        returncode, _, err = await run_client(
+            '--daemon-socket', path, '--jobs', '1', '--cache-dir', str(tmp_path / "cache_file"), 'unchanged.py')
+        assert returncode == 0
+        assert "Unable to open cache in" in err
+
+        returncode, out, _ = await run_client('--daemon-socket', path, 'missing.py')
+        assert returncode == 10
+        assert "Abort! Some filenames don't exist." in out
+
+        # Run locally
+        returncode, _, _ = await run_client('--daemon-socket', path, '--no-daemon', 'missing.py')
+        assert returncode == 10
+
+        returncode, _, err = await run_client('--daemon-socket', path)
+        assert returncode == 2
+        assert "the following arguments are required: filenames" in err
+
+    # Forwarded output isn't printed by the daemon
+    assert "All files" not in capsys.readouterr().out
+    assert requests == [
+        ['--daemon-socket', path, '--jobs', '1', 'added.py'],
+        ['--daemon-socket', path, '--jobs', '1', '--cache-dir', str(tmp_path / "cache_file"), 'unchanged.py'],
+        ['--daemon-socket', path, 'missing.py'],
+        ['--daemon-socket', path],
+    ]
+
+
+async def test_daemon_run_error(tmp_path: Path) -> None:
+    path = str(tmp_path / "daemon.sock")
+
+    async def run(argv: list[str]) -> int:
+        raise ValueError(f"Unable to handle {argv[-1]}")
+
+    task = asyncio.ensure_future(async_serve(path, run))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    try:
+        # The error is reported like a local crash, the connection isn't lost
+        returncode, out, err = await run_client('--daemon-socket', path, 'file.py')
+        assert returncode == 1
+        assert "Lost connection" not in out
+        assert "ValueError: Unable to handle file.py" in err
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+async def test_daemon_client_env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Default socket path of the client
+    path = os.path.join(tmp_path, f"python-typing-update-{os.getuid()}.sock")
+    env = {"XDG_RUNTIME_DIR": str(tmp_path), "TYPING_UPDATE_TEST": "client"}
+    monkeypatch.setattr(sys, "argv", ["python-typing-update", "missing.py"])
+    requests: list[list[str]] = []
+
+    async def run(argv: list[str]) -> int:
+        requests.append(argv)
+        print(os.environ.get("TYPING_UPDATE_TEST"))
+        return await async_main(argv)
+
+    task = asyncio.ensure_future(async_serve(path, run))
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    try:
+        # The run uses the environment of the client
+        returncode, out, _ = await run_client('--disable-committed-check', 'missing.py', env=env)
+        assert returncode == 10
+        assert out.startswith("client\n")
+        assert "TYPING_UPDATE_TEST" not in os.environ
+
+        # An empty argv isn't replaced by the one of the daemon
+        returncode, _, err = await run_client(env=env)
+        assert returncode == 2
+        assert "the following arguments are required: filenames" in err
+        assert requests == [['--disable-committed-check', 'missing.py'], []]
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+def test_config_stamp(tmp_path: Path) -> None:
+    stages.clear_config_caches()
+    stages.run_isort(str(tmp_path / "file.py"), "import os\n")
+    stamp = stages.config_stamp()
+    assert stamp[str(tmp_path / "pyproject.toml")] is None
+    assert stages.config_stamp() == stamp
+
+    tmp_path.joinpath("pyproject.toml").write_text("[tool.isort]\n", encoding="utf-8")
+    assert stages.config_stamp() != stamp
+    stages.clear_config_caches()
+    assert not stages.config_stamp()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from python_typing_update import discovery
+from python_typing_update.discovery import (
+    IgnoreRule, async_discover_files)
+
+
+@pytest.mark.parametrize(
+    ('pattern', 'path', 'is_dir', 'result'),
+    (
+        pytest.param("*.py", "a.py", False, True, id="name"),
+        pytest.param("*.py", "sub/a.py", False, True, id="name_any_depth"),
+        pytest.param("/*.py", "sub/a.py", False, False, id="anchored"),
+        pytest.param("sub/*.py", "sub/a.py", False, True, id="path"),
+        pytest.param("sub/*.py", "sub/nested/a.py", False, False, id="path_single_level"),
+        pytest.param("sub/**/*.py", "sub/nested/deep/a.py", False, True, id="double_star"),
+        pytest.param("**/build", "sub/build", True, True, id="leading_double_star"),
+        pytest.param("build/", "build", True, True, id="dir_only"),
+        pytest.param("build/", "build", False, False, id="dir_only_file"),
+        pytest.param("a?.py", "ab.py", False, True, id="question_mark"),
+        pytest.param("[!a]b.py", "ab.py", False, False, id="character_class"),
+        pytest.param("\\#file.py", "#file.py", False, True, id="escaped"),
+    ),
+)
+def test_ignore_rule(pattern: str, path: str, is_dir: bool, result: bool) -> None:
+    rule = IgnoreRule.from_pattern("/repo", pattern)
+    assert rule is not None
+    assert rule.match(os.path.join("/repo", *path.split("/")), is_dir) is result
+
+
+@pytest.mark.parametrize(
+    'pattern',
+    ("", "# comment", "/", "[z-a].py"),
+)
+def test_ignore_rule_skipped(pattern: str) -> None:
+    assert IgnoreRule.from_pattern("/repo", pattern) is None
+
+
+def create_tree(root: Path, files: list[str]) -> None:
+    for file_ in files:
+        path = root.joinpath(*file_.split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("", encoding="utf-8")
+
+
+async def discover(*args: str, exclude: tuple[str, ...] = ()) -> list[str]:
+    return [
+        file_.replace(os.sep, "/")
+        async for file_ in async_discover_files(args, exclude, num_workers=4)
+    ]
+
+
+async def test_discover_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    create_tree(tmp_path, [
+        "a.py", "notes.txt", "src/b.py", "src/pkg/c.py", "src/pkg/d.pyi",
+        "src/build/e.py", "src/generated/f.py", "src/generated/keep.py",
+        "venv/g.py", ".git/h.py",
+    ])
+    tmp_path.joinpath(".gitignore").write_text("venv/\nbuild/\n", encoding="utf-8")
+    tmp_path.joinpath("src", ".gitignore").write_text(
+        "generated/*\n!generated/keep.py\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+
+    assert sorted(await discover(".")) == [
+        "a.py", "src/b.py", "src/generated/keep.py", "src/pkg/c.py",
+    ]
+    assert sorted(await discover("src", exclude=("pkg/",))) == [
+        "src/b.py", "src/generated/keep.py",
+    ]
+    # Explicit files are never ignored and only yielded once
+    assert await discover("venv/g.py", "notes.txt", "venv/g.py") == ["venv/g.py", "notes.txt"]
+    assert sorted(await discover("**/c.py", "src/*.py")) == ["src/b.py", "src/pkg/c.py"]
+    assert sorted(await discover("src/*")) == [
+        "src/b.py", "src/generated/keep.py", "src/pkg/c.py",
+    ]
+    assert sorted(await discover("src/**/*.py", exclude=("generated/",))) == [
+        "src/b.py", "src/pkg/c.py",
+    ]
+
+
+@pytest.mark.parametrize(
+    ('pattern', 'files', 'scanned'),
+    (
+        pytest.param("*.py", ["a.py"], [""], id="base"),
+        pytest.param("src/*.py", ["src/b.py"], ["src"], id="sub_directory"),
+        pytest.param("src/*/*.py", ["src/pkg/c.py"], ["src", "src/pkg"], id="fixed_depth"),
+        pytest.param(
+            "src/**/d.py", ["src/pkg/deep/d.py"], ["src", "src/pkg", "src/pkg/deep"], id="double_star",
+        ),
+    ),
+)
+async def test_discover_files_glob_depth(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    pattern: str,
+    files: list[str],
+    scanned: list[str],
+) -> None:
+    create_tree(tmp_path, ["a.py", "src/b.py", "src/pkg/c.py", "src/pkg/deep/d.py"])
+    monkeypatch.chdir(tmp_path)
+    directories: list[str] = []
+    scan_directory = discovery._scan_directory  # pylint: disable=protected-access
+
+    def scan_directory_wrapper(directory: Any) -> Any:
+        directories.append(directory.path.replace(os.sep, "/"))
+        return scan_directory(directory)
+
+    monkeypatch.setattr(discovery, "_scan_directory", scan_directory_wrapper)
+    assert sorted(await discover(pattern)) == files
+    # Directories which can't contain a match aren't scanned
+    assert sorted(directories) == scanned
@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import asyncio
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+from typing import Any
 
 from _pytest.capture import CaptureFixture
 import aiofiles
 import pytest
 
+from python_typing_update import main, stages
 from python_typing_update.__main__ import async_main
-from python_typing_update.utils import async_restore_files
+from python_typing_update.summary import merge_summaries
+from python_typing_update.utils import async_restore_files, unified_diff
 
 FIXTURE_PATH = "tests/fixtures/"
 
@@ -25,10 +35,14 @@ async def async_check_changes(filename: str, control: str) -> None:
 
 @asynccontextmanager
 async def async_restore_fixtures(file_list: list[str]) -> AsyncGenerator[None]:
+    snapshot: dict[str, str] = {}
+    for file_ in file_list:
+        async with aiofiles.open(file_, encoding="utf-8", newline="") as fp:
+            snapshot[file_] = await fp.read()
     try:
         yield
     finally:
-        await async_restore_files(file_list)
+        await async_restore_files(snapshot, file_list)
 
 
 async def async_test_main(
@@ -91,6 +105,21 @@ async def async_test_main(
             ['-v'], 12,
             id="debug",
         ),
+        pytest.param(
+            'changed.py', 'changed_fixed.py',
+            ['--concurrent-files', '1'], 0,
+            id="single_concurrent_file",
+        ),
+        pytest.param(
+            'changed.py', 'changed_fixed.py',
+            ['--jobs', '1'], 0,
+            id="single_job",
+        ),
+        pytest.param(
+            'changed.py', 'changed_fixed.py',
+            ['--jobs', '2'], 0,
+            id="process_pool",
+        ),
     ),
 )
 async def test_main(
@@ -461,3 +490,432 @@ async def test_main_keep_updates(
     returncode: int,
 ) -> None:
     await async_test_main(filename, control, argv, returncode)
+
+
+@pytest.mark.parametrize(
+    ('filename', 'control', 'returncode'),
+    (
+        pytest.param(
+            'changed.py', 'changed_fixed.py', 0,
+            id="cache_updated",
+        ),
+        pytest.param(
+            'no_changes.py', 'no_changes_no_change.py', 0,
+            id="cache_no_changes",
+        ),
+        pytest.param(
+            'comment_1.py', 'comment_1_no_change.py', 2,
+            id="cache_comment",
+        ),
+    ),
+)
+async def test_main_cache(
+    filename: str,
+    control: str,
+    returncode: int,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    argv = ['--jobs', '1', '--no-prefilter', '--cache-dir', str(tmp_path)]
+    await async_test_main(filename, control, argv.copy(), returncode)
+
+    def update_content_fail(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("Result should have been cached")
+
+    # Second run, update stages are skipped
+    monkeypatch.setattr(main, "update_content", update_content_fail)
+    await async_test_main(filename, control, argv.copy(), returncode)
+
+    with pytest.raises(AssertionError):
+        await async_test_main(filename, control, [*argv, '--no-cache'], returncode)
+
+
+@pytest.mark.parametrize(
+    ('filename', 'control', 'argv', 'prefiltered'),
+    (
+        pytest.param(
+            'no_changes.py', 'no_changes_no_change.py',
+            None, 1,
+            id="prefilter_no_typing",
+        ),
+        pytest.param(
+            'no_changes.py', 'no_changes_no_change.py',
+            ['--no-prefilter'], 0,
+            id="prefilter_disabled",
+        ),
+        pytest.param(
+            'no_changes.py', 'no_changes_no_change.py',
+            ['--keep-updates'], 0,
+            id="prefilter_keep_updates",
+        ),
+        pytest.param(
+            'changed.py', 'changed_fixed.py',
+            None, 0,
+            id="prefilter_typing",
+        ),
+    ),
+)
+async def test_main_prefilter(
+    filename: str,
+    control: str,
+    argv: list[str] | None,
+    prefiltered: int,
+    capsys: CaptureFixture[str],
+) -> None:
+    await async_test_main(filename, control, argv, 0)
+    assert f"Skipped by pre-filter: {prefiltered}\n" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ('control', 'argv', 'returncode'),
+    (
+        pytest.param('no_typing_manual_no_change.py', ['--check'], 1, id="check"),
+        pytest.param('no_typing_manual_forced.py', ['--force'], 2, id="force"),
+        pytest.param('no_typing_manual_no_change.py', ['--no-prefilter'], 2, id="no_prefilter"),
+    ),
+)
+async def test_main_prefilter_manual_update(
+    control: str,
+    argv: list[str],
+    returncode: int,
+    capsys: CaptureFixture[str],
+) -> None:
+    """Files without typing syntax which pyupgrade still rewrites, e.g. 'io.open'."""
+    await async_test_main('no_typing_manual.py', control, argv, returncode, capsys)
+
+
+async def test_main_profile_stages(tmp_path: Path, capsys: CaptureFixture[str]) -> None:
+    profile_json = tmp_path / "profile.json"
+    argv = ['--jobs', '1', '--no-cache', '--profile-stages', '--profile-json', str(profile_json)]
+    await async_test_main('changed.py', 'changed_fixed.py', argv, 0)
+    out = capsys.readouterr().out
+    assert "--- Profile\n" in out
+    assert f" - {FIXTURE_PATH}changed.py: " in out
+
+    data = json.loads(profile_json.read_text(encoding="utf-8"))
+    assert set(data["phases"]) == {"pipeline", "formatter"}
+    assert set(data["stages"]) == {
+        "load", "read", "reorder-python-imports", "pyupgrade", "autoflake", "isort", "write",
+    }
+    assert data["stages"]["pyupgrade"]["count"] == 1
+    assert data["slowest_files"][0]["filename"] == FIXTURE_PATH + "changed.py"
+
+
+async def test_main_since(git_repo: Path, capsys: CaptureFixture[str]) -> None:
+    content = (git_repo / "unchanged.py").read_text(encoding="utf-8")
+    content_fixed = Path(__file__).parent.joinpath("fixtures", "changed_fixed.py").read_text(encoding="utf-8")
+    argv = ['--jobs', '1', '--since', 'base', 'unchanged.py', 'added.py', 'modified.py']
+    assert await async_main(argv) == 0
+    assert "All files: 2\n" in capsys.readouterr().out
+    assert (git_repo / "unchanged.py").read_text(encoding="utf-8") == content
+    assert (git_repo / "added.py").read_text(encoding="utf-8") == content_fixed
+    assert (git_repo / "modified.py").read_text(encoding="utf-8") != content
+
+    assert await async_main(['--since', 'unknown-ref', 'unchanged.py']) == 13
+
+
+@pytest.mark.parametrize('subdirectory', (False, True), ids=("absolute", "subdirectory"))
+async def test_main_since_paths(
+    git_repo: Path,
+    capsys: CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+    subdirectory: bool,
+) -> None:
+    filenames = [str(git_repo / name) for name in ("unchanged.py", "added.py", "modified.py")]
+    if subdirectory:
+        (git_repo / "sub").mkdir()
+        monkeypatch.chdir(git_repo / "sub")
+        filenames = [os.path.join("..", os.path.basename(name)) for name in filenames]
+    assert await async_main(['--jobs', '1', '--since', 'base', *filenames]) == 0
+    assert "All files: 2\n" in capsys.readouterr().out
+
+
+async def test_main_directory(git_repo: Path, capsys: CaptureFixture[str]) -> None:
+    content_fixed = Path(__file__).parent.joinpath("fixtures", "changed_fixed.py").read_text(encoding="utf-8")
+    assert await async_main(['--jobs', '1', '--exclude', 'modified.py', '.']) == 0
+    assert "All files: 2\n" in capsys.readouterr().out
+    assert (git_repo / "unchanged.py").read_text(encoding="utf-8") == content_fixed
+    assert (git_repo / "added.py").read_text(encoding="utf-8") == content_fixed
+    assert (git_repo / "modified.py").read_text(encoding="utf-8") != content_fixed
+
+    assert await async_main(['--disable-committed-check', 'missing/']) == 10
+
+
+async def test_main_uncommitted_changes(git_repo: Path, capsys: CaptureFixture[str]) -> None:
+    content = (git_repo / "added.py").read_text(encoding="utf-8")
+    (git_repo / "unchanged.py").write_text(content + "var8: List[int]\n", encoding="utf-8")
+    assert await async_main(['--jobs', '1', 'added.py', 'unchanged.py']) == 11
+    assert "Abort! Commit all changes" in capsys.readouterr().out
+    # No file was written
+    assert (git_repo / "added.py").read_text(encoding="utf-8") == content
+
+
+async def test_main_concurrent_runs(
+    git_repo: Path,
+    capsys: CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    run_isort_orig = stages.run_isort
+
+    def run_isort(filename: str, content: str) -> str:
+        print(f"isort output {filename}")
+        return run_isort_orig(filename, content)
+
+    monkeypatch.setattr(stages, "run_isort", run_isort)
+    content_fixed = Path(__file__).parent.joinpath("fixtures", "changed_fixed.py").read_text(encoding="utf-8")
+    argv = ['--jobs', '1', '--no-cache', '--disable-committed-check']
+    results = await asyncio.gather(
+        async_main([*argv, 'added.py']),
+        async_main([*argv, 'unchanged.py']),
+    )
+    assert list(results) == [0, 0]
+    assert (git_repo / "added.py").read_text(encoding="utf-8") == content_fixed
+    assert (git_repo / "unchanged.py").read_text(encoding="utf-8") == content_fixed
+    out = capsys.readouterr().out
+    # Output of the tools is captured per file, the summary of each run isn't
+    assert "isort output" not in out
+    assert out.count("All files: 1\n") == 2
+
+
+async def test_main_concurrent_runs_cache(git_repo: Path, tmp_path: Path) -> None:
+    content_fixed = Path(__file__).parent.joinpath("fixtures", "changed_fixed.py").read_text(encoding="utf-8")
+    files = ['added.py', 'unchanged.py', 'modified.py']
+    argv = ['--jobs', '1', '--cache-dir', str(tmp_path / "cache"), '--disable-committed-check', '--check']
+    # Both runs share the cache, neither blocks the other
+    for _ in range(2):
+        results = await asyncio.wait_for(
+            asyncio.gather(*(async_main([*argv, *files]) for _ in range(2))), timeout=20)
+        assert list(results) == [1, 1]
+
+    argv.remove('--check')
+    results_write = await asyncio.gather(async_main([*argv, *files[:2]]), async_main([*argv, files[2]]))
+    assert list(results_write) == [0, 0]
+    for file_ in files[:2]:
+        assert (git_repo / file_).read_text(encoding="utf-8") == content_fixed
+
+
+@pytest.mark.parametrize(
+    ('argv', 'returncode'),
+    (
+        pytest.param(['missing.py'], 10, id="missing_file"),
+        pytest.param(['--jobs', '1', 'added.py', 'unchanged.py'], 11, id="uncommitted_changes"),
+    ),
+)
+def test_main_lazy_imports(git_repo: Path, argv: list[str], returncode: int) -> None:
+    """Exits before the first update mustn't import the tools."""
+    (git_repo / "unchanged.py").write_text("var: List[int]\n", encoding="utf-8")
+    code = (
+        "import sys\n"
+        "from python_typing_update.__main__ import main\n"
+        f"assert main(['--no-daemon', *{argv!r}]) == {returncode}\n"
+        "print(sorted(name for name in ('autoflake', 'isort', 'pyupgrade', 'reorder_python_imports')"
+        " if name in sys.modules))\n"
+    )
+    # Slow git down, the files reach the update stage before the committed check is done
+    bin_dir = git_repo.parent / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "git").write_text(f"#!/bin/sh\nsleep 0.5\nexec {shutil.which('git')} \"$@\"\n", encoding="utf-8")
+    (bin_dir / "git").chmod(0o755)
+    process = subprocess.run(
+        [sys.executable, "-c", code], cwd=git_repo, capture_output=True, text=True, check=True,
+        env={
+            **os.environ,
+            "PYTHONPATH": str(Path(__file__).parents[1]),
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        },
+    )
+    assert process.stdout.splitlines()[-1] == "[]"
+
+
+async def test_main_check_read_only(git_repo: Path, capsys: CaptureFixture[str]) -> None:
+    path = git_repo / "unchanged.py"
+    content = path.read_text(encoding="utf-8") + "var8: List[int]\n"
+    path.write_text(content, encoding="utf-8")
+    path.chmod(0o444)
+    mtime = path.stat().st_mtime_ns
+    # Uncommitted changes don't matter, the file is never written
+    assert await async_main(['--jobs', '1', '--check', 'unchanged.py', 'added.py']) == 1
+    assert "The following files need to be updated:\n - added.py\n - unchanged.py\n" in capsys.readouterr().out
+    assert path.read_text(encoding="utf-8") == content
+    assert path.stat().st_mtime_ns == mtime
+
+
+async def test_main_diff(capsys: CaptureFixture[str]) -> None:
+    files = [FIXTURE_PATH + name for name in ('changed.py', 'no_changes.py', 'comment_1.py')]
+    argv = ['--jobs', '1', '--no-cache', '--diff', *files]
+    async with async_restore_fixtures(files):
+        assert await async_main(argv) == 1
+        for file_ in files:
+            await async_check_changes(file_, file_)
+    captured = capsys.readouterr()
+    content = Path(FIXTURE_PATH, 'changed.py').read_text(encoding="utf-8")
+    content_fixed = Path(FIXTURE_PATH, 'changed_fixed.py').read_text(encoding="utf-8")
+    # Only the diff, files which need a manual update are reported on stderr
+    assert captured.out == unified_diff(FIXTURE_PATH + 'changed.py', content, content_fixed)
+    assert captured.err == f"Could not update all files, check:\n - {FIXTURE_PATH}comment_1.py\n"
+
+    assert await async_main(['--diff', FIXTURE_PATH + 'no_changes.py']) == 0
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize('mode', ([], ['--check'], ['--force']), ids=("update", "check", "force"))
+async def test_main_shard(tmp_path: Path, capsys: CaptureFixture[str], mode: list[str]) -> None:
+    files = [
+        FIXTURE_PATH + name
+        for name in ('changed.py', 'no_changes.py', 'comment_1.py', 'comment_2.py', 'unused_import_1.py')
+    ]
+    argv = ['--jobs', '1', '--no-cache', '--disable-committed-check', *mode, *files]
+    async with async_restore_fixtures(files):
+        returncode = await async_main([*argv, '--summary-json', str(tmp_path / "full.json")])
+    output = capsys.readouterr().out
+
+    reports = [str(tmp_path / f"shard_{index}.json") for index in range(1, 4)]
+    async with async_restore_fixtures(files):
+        for index, report in enumerate(reports, start=1):
+            await async_main([*argv, '--shard', f"{index}/3", '--summary-json', report])
+    capsys.readouterr()
+
+    # Merged shards report the same summary as a single run
+    assert merge_summaries(reports) == returncode
+    assert capsys.readouterr().out == output
+    assert merge_summaries([str(tmp_path / "full.json")]) == returncode
+    assert capsys.readouterr().out == output
+
+    assert merge_summaries(reports[:2]) == 10
+    assert capsys.readouterr().out == "Abort! Missing reports for shards: 3/3\n"
+
+
+async def test_main_summary_json_aborted(tmp_path: Path, capsys: CaptureFixture[str]) -> None:
+    report = str(tmp_path / "report.json")
+    assert await async_main(['--summary-json', report, 'missing.py']) == 10
+    capsys.readouterr()
+    assert merge_summaries([report]) == 10
+    assert capsys.readouterr().out == f"Abort! The run for '{report}' failed with 10.\n"
+
+
+async def test_main_only_force_summary(capsys: CaptureFixture[str]) -> None:
+    files = [FIXTURE_PATH + name for name in ('changed.py', 'no_changes.py', 'comment_1.py', 'comment_2.py')]
+    async with async_restore_fixtures(files):
+        argv = ['--jobs', '1', '--no-cache', '--disable-committed-check', '--only-force']
+        assert await async_main([*argv, *files]) == 2
+    # Only files with comments are processed and counted
+    assert capsys.readouterr().out.endswith(
+        "---\n"
+        "All files: 2\n"
+        "No changes: 0\n"
+        "Skipped by pre-filter: 0\n"
+        "Files updated: 0\n"
+        "Files (no automatic update): 2\n"
+    )
+
+
+async def test_main_manual_update_not_written(capsys: CaptureFixture[str]) -> None:
+    files = [FIXTURE_PATH + 'comment_1.py', FIXTURE_PATH + 'no_changes.py', FIXTURE_PATH + 'changed.py']
+    mtimes = {file_: Path(file_).stat().st_mtime_ns for file_ in files}
+    async with async_restore_fixtures(files):
+        assert await async_main(['--jobs', '1', '--disable-committed-check', *files]) == 2
+        # Files which need a manual update are never written
+        assert Path(files[0]).stat().st_mtime_ns == mtimes[files[0]]
+        assert Path(files[1]).stat().st_mtime_ns == mtimes[files[1]]
+        await async_check_changes(files[2], FIXTURE_PATH + 'changed_fixed.py')
+    assert (
+        "Could not update all files, check:\n"
+        f" - {files[0]}\n"
+        "---\n"
+        "All files: 3\n"
+        "No changes: 1\n"
+        "Skipped by pre-filter: 1\n"
+        "Files updated: 1\n"
+        "Files (no automatic update): 1\n"
+    ) in capsys.readouterr().out
+
+
+async def test_main_report_json(tmp_path: Path) -> None:
+    files = [FIXTURE_PATH + name for name in ('changed.py', 'no_changes.py', 'comment_1.py', 'unused_import_5.py')]
+    report = tmp_path / "report.jsonl"
+    argv = ['--jobs', '1', '--no-cache', '--disable-committed-check', '--report-json', str(report)]
+    async with async_restore_fixtures(files):
+        assert await async_main([*argv, *files]) == 2
+
+    lines = [json.loads(line) for line in report.read_text(encoding="utf-8").splitlines()]
+    assert lines[-1] == {"totals": {
+        "returncode": 2, "num_files": 4, "num_no_changes": 1, "num_prefiltered": 1,
+        "num_updated": 3, "num_no_automatic_update": 2,
+    }}
+    results = {line["file"]: line for line in lines[:-1]}
+    assert len(results) == len(lines) - 1
+    assert {file_: result["status"] for file_, result in results.items()} == {
+        files[0]: "updated",
+        files[1]: "prefiltered",
+        files[2]: "comment",
+        files[3]: "imports_changed",
+    }
+    assert results[files[2]]["flags"] == ["COMMENT"]
+    assert results[files[3]]["imports_removed"] == ["logging", "typing.List"]
+    assert set(results[files[1]]["timings"]) == {"load"}
+    assert {"load", "read", "isort"}.issubset(results[files[0]]["timings"])
+
+    # Aborted run
+    assert await async_main([*argv, 'missing.py']) == 10
+    assert report.read_text(encoding="utf-8") == '{"totals": {"returncode": 10}}\n'
+
+
+@pytest.mark.parametrize('concurrent_files', (1, 8))
+async def test_main_limit(
+    concurrent_files: int,
+    git_repo: Path,
+    tmp_path: Path,
+    capsys: CaptureFixture[str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    content = (git_repo / "added.py").read_text(encoding="utf-8")
+    files = [f"file_{i:02d}.py" for i in range(20)]
+    for file_ in files:
+        (git_repo / file_).write_text(content, encoding="utf-8")
+    (git_repo / "no_typing.py").write_text("var = 1\n", encoding="utf-8")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", "files"],
+        check=True,
+    )
+
+    updated: list[str] = []
+    update_content_orig = main.update_content
+
+    def update_content(filename: str, *args: Any) -> Any:
+        updated.append(filename)
+        return update_content_orig(filename, *args)
+
+    monkeypatch.setattr(main, "update_content", update_content)
+    report = tmp_path / "report.jsonl"
+    argv = [
+        '--jobs', '1', '--concurrent-files', str(concurrent_files), '--no-cache', '--limit', '2',
+        '--report-json', str(report),
+    ]
+    assert await async_main([*argv, 'no_typing.py', *files]) == 0
+    # Stopped once the limit was reached, files in progress are restored
+    if concurrent_files == 1:
+        # One more, to tell that the limit applied
+        assert updated == files[:3]
+        assert "Limit applied! Only updated the first 2 of at least 3 files\n" in capsys.readouterr().out
+    else:
+        assert set(files[:3]).issubset(updated)
+        assert "Limit applied! Only updated the first 2 of at least" in capsys.readouterr().out
+    changed = subprocess.run(
+        ["git", "diff", "--name-only"], capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    assert changed == files[:2]
+    statuses: dict[str, str] = {}
+    for line in report.read_text(encoding="utf-8").splitlines()[:-1]:
+        result = json.loads(line)
+        statuses[result["file"]] = result["status"]
+    assert statuses.pop("no_typing.py") == "prefiltered"
+    assert [statuses.pop(file_) for file_ in files[:2]] == ["updated", "updated"]
+    assert set(statuses.values()).issubset({"restored"})
+
+    # Exactly limit files need an update
+    subprocess.run(["git", "restore", "."], check=True)
+    assert await async_main([*argv[:-2], 'no_typing.py', *files[:2]]) == 0
+    assert "Limit" not in capsys.readouterr().out
+    assert await async_main([*argv[:-2], '--limit', '5', *files[2:5]]) == 0
+    assert "Limit" not in capsys.readouterr().out
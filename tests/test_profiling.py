@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import pytest
+
+from python_typing_update.profiling import StageProfile, percentile
+
+
+@pytest.mark.parametrize(
+    ('values', 'percent', 'result'),
+    (
+        pytest.param([], 50, 0.0, id="empty"),
+        pytest.param([1.0], 95, 1.0, id="single"),
+        pytest.param([1.0, 2.0, 3.0, 4.0], 50, 2.0, id="p50"),
+        pytest.param([float(i) for i in range(1, 101)], 95, 95.0, id="p95"),
+    ),
+)
+def test_percentile(values: list[float], percent: int, result: float) -> None:
+    assert percentile(values, percent) == result
+
+
+def test_stage_profile() -> None:
+    profile = StageProfile(enabled=True)
+    profile.add("read", 0.5, "a.py")
+    profile.add_all({"read": 1.5, "isort": 1.0}, "b.py")
+    with profile.measure_phase("pipeline"):
+        pass
+
+    data = profile.to_dict()
+    assert set(data["phases"]) == {"pipeline"}
+    assert data["stages"]["read"] == {"count": 2, "total": 2.0, "p50": 0.5, "p95": 1.5, "max": 1.5}
+    assert data["slowest_files"] == [
+        {"filename": "b.py", "total": 2.5},
+        {"filename": "a.py", "total": 0.5},
+    ]
+
+
+def test_stage_profile_disabled() -> None:
+    profile = StageProfile(enabled=False)
+    profile.add("read", 0.5, "a.py")
+    with profile.measure("isort", "a.py"), profile.measure_phase("pipeline"):
+        pass
+    assert profile.to_dict() == {"phases": {}, "stages": {}, "slowest_files": []}
+
+
+def test_stage_profile_per_file() -> None:
+    profile = StageProfile(enabled=False, per_file=True)
+    profile.add("read", 0.5, "a.py")
+    profile.add_all({"read": 1.5, "isort": 1.0}, "a.py")
+    profile.add("read", 1.0)
+    assert profile.pop_file("a.py") == {"read": 2.0, "isort": 1.0}
+    assert profile.pop_file("a.py") == {}
+    assert profile.to_dict() == {"phases": {}, "stages": {}, "slowest_files": []}
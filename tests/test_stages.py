@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+
+from _pytest.capture import CaptureFixture
+
+from python_typing_update.stages import (
+    _isort_config, capture_output, run_isort)
+
+CONTENT_ISORT = """\
+from typing_extensions import TypedDict
+from collections.abc import Hashable
+"""
+
+
+def test_capture_output(capsys: CaptureFixture[str]) -> None:
+    stdout, stderr = sys.stdout, sys.stderr
+    with capture_output() as outer:
+        print("outer")
+        with capture_output() as inner:
+            print("inner", file=sys.stderr)
+        print("outer again")
+
+        # Other threads aren't captured
+        thread = threading.Thread(target=print, args=("thread",))
+        thread.start()
+        thread.join()
+
+    assert outer.getvalue() == "outer\nouter again\n"
+    assert inner.getvalue() == "inner\n"
+    # Streams are restored
+    assert sys.stdout is stdout
+    assert sys.stderr is stderr
+    assert capsys.readouterr().out == "thread\n"
+
+
+def test_run_isort_threads() -> None:
+    """The isort config is shared by all threads, sort in parallel with a new one."""
+    filename = "tests/fixtures/changed.py"
+    barrier = threading.Barrier(8)
+
+    def sort() -> str:
+        barrier.wait()
+        return run_isort(filename, CONTENT_ISORT)
+
+    switch_interval = sys.getswitchinterval()
+    # Switch threads more often
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(10):
+            _isort_config.cache_clear()
+            _isort_config(os.path.dirname(os.path.abspath(filename)))
+            with ThreadPoolExecutor(8) as executor:
+                results = [executor.submit(sort) for _ in range(8)]
+            assert {result.result() for result in results} == {
+                "from collections.abc import Hashable\n\nfrom typing_extensions import TypedDict\n"
+            }
+    finally:
+        sys.setswitchinterval(switch_interval)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from _pytest.capture import CaptureFixture
+import pytest
+
+from python_typing_update.summary import (
+    RunSummary, SummaryOptions, merge_summaries, print_summary,
+    write_summary_json)
+
+OPTIONS = SummaryOptions(check=False, diff=False, force=False, verbose=0)
+
+
+def test_merge() -> None:
+    summary = RunSummary.merge([
+        RunSummary(3, 1, 1, ["b.py", "d.py"], ["d.py"], []),
+        RunSummary(2, 0, 0, ["a.py", "c.py"], ["c.py"], ["a.py", "c.py"]),
+    ])
+    assert summary == RunSummary(5, 1, 1, ["a.py", "b.py", "c.py", "d.py"], ["c.py", "d.py"], ["a.py", "c.py"])
+    assert summary.files_no_automatic_update == {"a.py", "c.py", "d.py"}
+
+
+@pytest.mark.parametrize(
+    ('options', 'summary', 'returncode'),
+    (
+        pytest.param(OPTIONS, RunSummary(2, 1, 0, ["a.py"], [], []), 0, id="updated"),
+        pytest.param(OPTIONS, RunSummary(2, 1, 0, ["a.py"], ["a.py"], []), 2, id="no_automatic_update"),
+        pytest.param(OPTIONS._replace(verbose=1), RunSummary(2, 1, 0, ["a.py"], [], []), 12, id="verbose"),
+        pytest.param(OPTIONS._replace(check=True), RunSummary(2, 1, 0, ["a.py"], [], []), 1, id="check"),
+        pytest.param(OPTIONS._replace(check=True), RunSummary(2, 2, 0, [], [], []), 0, id="check_passed"),
+        pytest.param(OPTIONS._replace(diff=True), RunSummary(2, 1, 0, ["a.py"], ["a.py"], []), 0, id="diff"),
+    ),
+)
+def test_print_summary(options: SummaryOptions, summary: RunSummary, returncode: int) -> None:
+    assert print_summary(summary, options) == returncode
+
+
+def test_merge_summaries_invalid(tmp_path: Path, capsys: CaptureFixture[str]) -> None:
+    summary = RunSummary(1, 1, 0, [], [], [])
+    report_1 = str(tmp_path / "report_1.json")
+    report_2 = str(tmp_path / "report_2.json")
+    write_summary_json(report_1, OPTIONS, 0, summary, (1, 2))
+
+    assert merge_summaries([report_1, str(tmp_path / "missing.json")]) == 10
+    assert "Unable to read report" in capsys.readouterr().out
+
+    write_summary_json(report_2, OPTIONS._replace(check=True), 0, summary, (2, 2))
+    assert merge_summaries([report_1, report_2]) == 10
+    assert "different options" in capsys.readouterr().out
+
+    write_summary_json(report_2, OPTIONS, 0, summary, (1, 2))
+    assert merge_summaries([report_1, report_2]) == 10
+    assert "different shard" in capsys.readouterr().out
+
+    write_summary_json(report_2, OPTIONS, 0, summary, (2, 3))
+    assert merge_summaries([report_1, report_2]) == 10
+    assert "different number of shards" in capsys.readouterr().out
+
+    write_summary_json(report_2, OPTIONS, 11, None, (2, 2))
+    assert merge_summaries([report_1, report_2]) == 11
+
+    write_summary_json(report_2, OPTIONS, 0, summary, (2, 2))
+    assert merge_summaries([report_1, report_2]) == 0
+    assert "All files: 2\n" in capsys.readouterr().out
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
 import io
+from pathlib import Path
+import subprocess
 from textwrap import dedent
 
 import pytest
 
+from python_typing_update import utils
 from python_typing_update.const import FileStatus
 from python_typing_update.utils import (
-    check_comment_between_imports, extract_imports)
+    abs_path, analyze_file, analyze_imports, async_changed_files,
+    async_check_uncommitted_changes, check_comment_between_imports,
+    chunk_file_list, extract_imports, in_shard, may_need_typing_update,
+    unified_diff)
 
 
 @pytest.mark.parametrize(
@@ -360,3 +366,230 @@ def test_comment_detection_ignore_comment(code: str, return_value: FileStatus) -
 def test_list_imports(code: str, import_set: set[str]) -> None:
     fp = io.StringIO(code)
     assert extract_imports(fp) == import_set
+
+
+@pytest.mark.parametrize(
+    ('code', 'return_value', 'import_set'),
+    (
+        pytest.param(
+            dedent("""\
+            import sys
+            # This is a comment
+            from typing import Any, List  # comment
+
+            var: Any = sys.version
+            """),
+            FileStatus.COMMENT | FileStatus.COMMENT_TYPING,
+            {"sys", "typing.Any", "typing.List"},
+            id="comment_typing_import",
+        ),
+        pytest.param(
+            dedent("""\
+            import logging, sys
+            from .const import MY_CONST
+
+            import os
+            """),
+            FileStatus.CLEAR,
+            {"logging", "sys", ".const.MY_CONST", "os"},
+            id="no_comment",
+        ),
+    ),
+)
+def test_analyze_imports(code: str, return_value: FileStatus, import_set: set[str]) -> None:
+    fp = io.StringIO(code)
+    assert analyze_imports(fp) == (return_value, import_set)
+
+
+@pytest.mark.parametrize(
+    ('code', 'min_version', 'return_value'),
+    (
+        pytest.param(
+            dedent("""\
+            import sys
+
+            var: int = 1
+            """),
+            (3, 10), False,
+            id="no_typing",
+        ),
+        pytest.param(
+            dedent("""\
+            from typing import List
+
+            var: List[int]
+            """),
+            (3, 10), True,
+            id="typing_import",
+        ),
+        pytest.param(
+            dedent("""\
+            import typing_extensions
+            """),
+            (3, 10), True,
+            id="typing_extensions_import",
+        ),
+        pytest.param(
+            dedent("""\
+            from collections.abc import Generator
+
+            def func() -> Generator[int, None, None]: ...
+            """),
+            (3, 12), False,
+            id="generator_py312",
+        ),
+        pytest.param(
+            dedent("""\
+            from collections.abc import Generator
+
+            def func() -> Generator[int, None, None]: ...
+            """),
+            (3, 13), True,
+            id="generator_py313",
+        ),
+        pytest.param(
+            dedent("""\
+            from __future__ import annotations
+
+            def func(var: "Foo") -> None: ...
+            """),
+            (3, 10), True,
+            id="string_annotation_future_import",
+        ),
+        pytest.param(
+            dedent("""\
+            def func(var: "Foo") -> None: ...
+            """),
+            (3, 10), False,
+            id="string_annotation_py310",
+        ),
+        pytest.param(
+            dedent("""\
+            var: list["Foo"] = []
+            """),
+            (3, 14), True,
+            id="string_annotation_py314",
+        ),
+        pytest.param(
+            dedent("""\
+            from __future__ import annotations
+
+            var = {"key": "value"}
+            """),
+            (3, 10), False,
+            id="no_string_annotation",
+        ),
+        pytest.param(
+            dedent("""\
+            from __future__ import annotations
+
+            def func(变量: "Foo") -> None: ...
+            """),
+            (3, 10), True,
+            id="string_annotation_non_ascii_name",
+        ),
+    ),
+)
+def test_may_need_typing_update(code: str, min_version: tuple[int, int], return_value: bool) -> None:
+    assert may_need_typing_update(code, min_version) is return_value
+    assert may_need_typing_update(code.encode(), min_version) is return_value
+
+
+def test_analyze_file(tmp_path: Path) -> None:
+    path = tmp_path / "file.py"
+    path.write_text("", encoding="utf-8")
+    assert analyze_file(str(path), (3, 10)) == (FileStatus.CLEAR, set(), False)
+
+    # Reading stops after the import block, the rest isn't decoded
+    path.write_bytes(b"import os\nfrom typing import List  # comment\n\n" + b"var = 1\n" * 10_000 + b"\xff\n")
+    assert analyze_file(str(path), (3, 10)) == (
+        FileStatus.COMMENT | FileStatus.COMMENT_TYPING, {"os", "typing.List"}, True)
+
+    path.write_bytes(b"import os\n\nvar = 1\n")
+    assert analyze_file(str(path), (3, 10)) == (FileStatus.CLEAR, {"os"}, False)
+
+
+def test_chunk_file_list() -> None:
+    file_list = ["a.py", "b.py", "c.py", "long_name.py"]
+    assert list(chunk_file_list(file_list, max_length=10)) == [
+        ["a.py", "b.py"], ["c.py"], ["long_name.py"],
+    ]
+    assert list(chunk_file_list(file_list)) == [file_list]
+    assert not list(chunk_file_list([]))
+
+
+@pytest.mark.parametrize(
+    'content',
+    (
+        pytest.param("var: List[int]\nvar8 = 1\n", id="trailing_newline"),
+        pytest.param("var: List[int]\nvar8 = 1", id="no_trailing_newline"),
+    ),
+)
+def test_unified_diff(git_repo: Path, content: str) -> None:
+    content_orig = (git_repo / "added.py").read_text(encoding="utf-8")
+    (git_repo / "added.py").write_text(content, encoding="utf-8")
+    git_diff = subprocess.run(
+        ["git", "diff", "--no-color", "--no-ext-diff", "-U3", "added.py"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    # Skip 'diff --git' and 'index' header lines
+    assert unified_diff("added.py", content_orig, content) == git_diff.split("\n", 2)[2]
+
+
+def test_in_shard() -> None:
+    files = [f"src/module_{i}.py" for i in range(100)]
+    shards = [[file_ for file_ in files if in_shard(file_, index, 4)] for index in range(1, 5)]
+    # Every file is in exactly one shard
+    assert sorted(file_ for shard in shards for file_ in shard) == sorted(files)
+    assert all(shards)
+    assert in_shard("./src/module_1.py", 2, 4) is in_shard("src/module_1.py", 2, 4)
+    assert all(in_shard(file_, 1, 1) for file_ in files)
+
+
+async def test_async_changed_files(git_repo: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    assert await async_changed_files("base") == {abs_path("added.py"), abs_path("modified.py")}
+    assert await async_changed_files("HEAD") == set()
+
+    (git_repo / "unchanged.py").write_text("var = 1\n", encoding="utf-8")
+    assert await async_changed_files("HEAD") == {abs_path("unchanged.py")}
+
+    # Files outside of the working directory
+    (git_repo / "sub").mkdir()
+    monkeypatch.chdir(git_repo / "sub")
+    assert await async_changed_files("HEAD") == {abs_path("../unchanged.py")}
+
+    assert await async_changed_files("unknown-ref") is None
+
+
+@pytest.mark.parametrize('max_cmd_length', (utils.MAX_CMD_LENGTH, 10), ids=("pathspecs", "full_diff"))
+async def test_async_check_uncommitted_changes(
+    git_repo: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    max_cmd_length: int,
+) -> None:
+    monkeypatch.setattr(utils, "MAX_CMD_LENGTH", max_cmd_length)
+    assert await async_check_uncommitted_changes(["."]) is True
+
+    (git_repo / "unchanged.py").write_text("var = 1\n", encoding="utf-8")
+    (git_repo / "notes.txt").write_text("changed\n", encoding="utf-8")
+    assert await async_check_uncommitted_changes(["added.py"]) is True
+    assert await async_check_uncommitted_changes(["unchanged.py"]) is False
+    assert await async_check_uncommitted_changes(["notes.txt"]) is False
+    assert await async_check_uncommitted_changes(["."]) is False
+    assert await async_check_uncommitted_changes(["un*.py"]) is False
+    assert await async_check_uncommitted_changes(["add*.py"]) is True
+
+
+def test_inputs_matcher(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    matches = utils._inputs_matcher(["a.py", "./pkg/sub", "tests/test_*.py"])  # pylint: disable=protected-access
+    assert matches("a.py") is True
+    assert matches("pkg/sub/b.py") is True
+    assert matches("pkg/sub/c/d.py") is True
+    assert matches("pkg/sub/notes.txt") is False
+    assert matches("pkg/b.py") is False
+    assert matches("tests/test_a.py") is True
+    assert matches("b.py") is False
+
+    assert utils._inputs_matcher(["."])("pkg/b.py") is True  # pylint: disable=protected-access